@@ -17,7 +17,20 @@ fileConfig(config.config_file_name)
 # for 'autogenerate' support
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
-target_metadata = None
+from config import load_settings
+from models import Base
+
+target_metadata = Base.metadata
+
+# Migrate the same database the application is configured to use
+config.set_main_option("sqlalchemy.url", load_settings()["database_url"])
+
+
+# The product search index (products_fts and its FTS5 shadow tables) is
+# managed by hand in its migration, so autogenerate must leave it alone
+def include_name(name, type_, parent_names):
+    return not (type_ == "table" and name.startswith("products_fts"))
+
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
@@ -42,6 +55,7 @@ def run_migrations_offline():
         url=url,
         target_metadata=target_metadata,
         literal_binds=True,
+        include_name=include_name,
         dialect_opts={"paramstyle": "named"},
     )
 
@@ -64,7 +78,9 @@ def run_migrations_online():
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            include_name=include_name,
         )
 
         with context.begin_transaction():
@@ -0,0 +1,54 @@
+"""initial schema
+
+Revision ID: 3f1c2a9d8b10
+Revises: 
+Create Date: 2026-10-18 09:12:41.508216
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d8b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'products',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('brand', sa.String(), nullable=True),
+        sa.Column('price', sa.Integer(), nullable=True),
+        sa.Column('quantity', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_table(
+        'customers',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('email', sa.String(), nullable=True),
+        sa.Column('username', sa.String(), nullable=True),
+        sa.Column('role', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_table(
+        'orders',
+        sa.Column('order_id', sa.Integer(), nullable=False),
+        sa.Column('customer_id', sa.Integer(), nullable=True),
+        sa.Column('product_id', sa.Integer(), nullable=True),
+        sa.Column('order_date', sa.Date(), nullable=True),
+        sa.Column('quantity', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['customer_id'], ['customers.id']),
+        sa.ForeignKeyConstraint(['product_id'], ['products.id']),
+        sa.PrimaryKeyConstraint('order_id'),
+    )
+
+
+def downgrade():
+    op.drop_table('orders')
+    op.drop_table('customers')
+    op.drop_table('products')
@@ -0,0 +1,35 @@
+"""add order count to daily product sales
+
+Revision ID: 4c8e1b7d2f95
+Revises: 9d4b2f6e8a13
+Create Date: 2026-10-18 16:48:12.530981
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c8e1b7d2f95'
+down_revision = '9d4b2f6e8a13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'daily_product_sales',
+        sa.Column('order_count', sa.Integer(), server_default='0', nullable=False),
+    )
+    # Backfill from the existing orders
+    op.execute(
+        "UPDATE daily_product_sales SET order_count = ("
+        "SELECT COUNT(*) FROM orders "
+        "WHERE orders.product_id = daily_product_sales.product_id "
+        "AND orders.order_date = daily_product_sales.day)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('daily_product_sales') as batch_op:
+        batch_op.drop_column('order_count')
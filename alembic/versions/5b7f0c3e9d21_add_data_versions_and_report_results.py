@@ -0,0 +1,39 @@
+"""add data versions and report results
+
+Revision ID: 5b7f0c3e9d21
+Revises: c2d9e4f1a7b6
+Create Date: 2026-10-18 13:41:19.265034
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7f0c3e9d21'
+down_revision = 'c2d9e4f1a7b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'data_versions',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    op.create_table(
+        'report_results',
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('data_version', sa.String(), nullable=False),
+        sa.Column('result', sa.Text(), nullable=False),
+        sa.Column('computed_at', sa.DateTime(), nullable=False),
+        sa.Column('compute_ms', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+    )
+
+
+def downgrade():
+    op.drop_table('report_results')
+    op.drop_table('data_versions')
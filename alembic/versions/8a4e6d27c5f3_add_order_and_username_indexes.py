@@ -0,0 +1,32 @@
+"""add order and username indexes
+
+Revision ID: 8a4e6d27c5f3
+Revises: 3f1c2a9d8b10
+Create Date: 2026-10-18 09:20:07.113904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4e6d27c5f3'
+down_revision = '3f1c2a9d8b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_orders_product_id_order_date', 'orders', ['product_id', 'order_date'], unique=False
+    )
+    op.create_index(
+        'ix_orders_customer_id_order_date', 'orders', ['customer_id', 'order_date'], unique=False
+    )
+    op.create_index(op.f('ix_customers_username'), 'customers', ['username'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_customers_username'), table_name='customers')
+    op.drop_index('ix_orders_customer_id_order_date', table_name='orders')
+    op.drop_index('ix_orders_product_id_order_date', table_name='orders')
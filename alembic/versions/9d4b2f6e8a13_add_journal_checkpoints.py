@@ -0,0 +1,29 @@
+"""add journal checkpoints
+
+Revision ID: 9d4b2f6e8a13
+Revises: e7a3c5d91f42
+Create Date: 2026-10-18 16:05:44.902317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4b2f6e8a13'
+down_revision = 'e7a3c5d91f42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'journal_checkpoints',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+
+
+def downgrade():
+    op.drop_table('journal_checkpoints')
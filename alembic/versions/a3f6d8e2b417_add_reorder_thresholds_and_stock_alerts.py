@@ -0,0 +1,44 @@
+"""add reorder thresholds and stock alerts
+
+Revision ID: a3f6d8e2b417
+Revises: 4c8e1b7d2f95
+Create Date: 2026-10-18 17:26:16.272100
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f6d8e2b417'
+down_revision = '4c8e1b7d2f95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('products', sa.Column('reorder_threshold', sa.Integer(), nullable=True))
+    op.create_index(
+        'ix_products_low_stock',
+        'products',
+        ['quantity'],
+        sqlite_where=sa.text('quantity <= reorder_threshold'),
+        postgresql_where=sa.text('quantity <= reorder_threshold'),
+    )
+    op.create_table(
+        'stock_alerts',
+        sa.Column('alert_id', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('reorder_threshold', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['product_id'], ['products.id']),
+        sa.PrimaryKeyConstraint('alert_id'),
+    )
+
+
+def downgrade():
+    op.drop_table('stock_alerts')
+    op.drop_index('ix_products_low_stock', table_name='products')
+    op.drop_column('products', 'reorder_threshold')
@@ -0,0 +1,41 @@
+"""add daily product sales rollup
+
+Revision ID: c2d9e4f1a7b6
+Revises: 8a4e6d27c5f3
+Create Date: 2026-10-18 11:02:36.847120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2d9e4f1a7b6'
+down_revision = '8a4e6d27c5f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'daily_product_sales',
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('units', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['product_id'], ['products.id']),
+        sa.PrimaryKeyConstraint('product_id', 'day'),
+    )
+    # Backfill from the existing orders
+    op.execute(
+        "INSERT INTO daily_product_sales (product_id, day, units, revenue) "
+        "SELECT orders.product_id, orders.order_date, SUM(orders.quantity), "
+        "SUM(orders.quantity * COALESCE(products.price, 0)) "
+        "FROM orders LEFT OUTER JOIN products ON products.id = orders.product_id "
+        "WHERE orders.product_id IS NOT NULL AND orders.order_date IS NOT NULL "
+        "GROUP BY orders.product_id, orders.order_date"
+    )
+
+
+def downgrade():
+    op.drop_table('daily_product_sales')
@@ -0,0 +1,55 @@
+"""add product search index
+
+Revision ID: e7a3c5d91f42
+Revises: 5b7f0c3e9d21
+Create Date: 2026-10-18 15:32:07.481150
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3c5d91f42'
+down_revision = '5b7f0c3e9d21'
+branch_labels = None
+depends_on = None
+
+
+# FTS5 is SQLite only; other databases search with LIKE and need nothing here
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(
+        """CREATE VIRTUAL TABLE products_fts USING fts5(
+            name, brand, content='products', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )"""
+    )
+    op.execute(
+        """CREATE TRIGGER products_fts_insert AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts (rowid, name, brand) VALUES (new.id, new.name, new.brand);
+        END"""
+    )
+    op.execute(
+        """CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, brand)
+            VALUES ('delete', old.id, old.name, old.brand);
+        END"""
+    )
+    op.execute(
+        """CREATE TRIGGER products_fts_update AFTER UPDATE OF name, brand ON products BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, brand)
+            VALUES ('delete', old.id, old.name, old.brand);
+            INSERT INTO products_fts (rowid, name, brand) VALUES (new.id, new.name, new.brand);
+        END"""
+    )
+    op.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute('DROP TRIGGER products_fts_update')
+    op.execute('DROP TRIGGER products_fts_delete')
+    op.execute('DROP TRIGGER products_fts_insert')
+    op.execute('DROP TABLE products_fts')
@@ -0,0 +1,128 @@
+import datetime
+from collections import namedtuple
+
+from sqlalchemy import select
+
+from models import Product, daily_product_sales
+
+# One line of the "reorder soon" report
+ReorderLine = namedtuple(
+    "ReorderLine",
+    "id name brand quantity avg_daily_units recent_daily_units days_of_stock reorder_point",
+)
+
+
+# Daily units sold per product over a window of days, as a dense NumPy
+# matrix: sales[i, d] is what product_ids[i] sold on days[d]
+class SalesMatrix:
+    def __init__(self, product_ids, days, sales):
+        self.product_ids = product_ids
+        self.days = days
+        self.sales = sales
+
+    # Trailing sums over `width` days, one column per day from the
+    # width-th day on, computed for every product at once from a cumulative sum
+    def rolling_sum(self, width):
+        np = _numpy()
+        cumulative = np.zeros((self.sales.shape[0], self.sales.shape[1] + 1))
+        np.cumsum(self.sales, axis=1, out=cumulative[:, 1:])
+        return cumulative[:, width:] - cumulative[:, :-width]
+
+    def moving_average(self, width):
+        return self.rolling_sum(width) / width
+
+    # Average daily units over the last `width` days of the window
+    def recent_average(self, width):
+        return self.sales[:, -width:].mean(axis=1)
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("The analytics reports need numpy installed.")
+    return numpy
+
+
+# Function to load the daily sales of every product for the `days` days up
+# to and including end_date in one query. The rows come from the daily sales
+# rollup, which already holds one row per product per day, and are scattered
+# into a (products x days) matrix; products without sales get a zero row.
+def load_sales_matrix(session, days, end_date=None):
+    np = _numpy()
+    end_date = end_date or datetime.date.today()
+    start_date = end_date - datetime.timedelta(days=days - 1)
+
+    product_ids = np.array(
+        session.execute(select(Product.id).order_by(Product.id)).scalars().all(), dtype=np.int64
+    )
+    rows = session.execute(
+        select(
+            daily_product_sales.c.product_id,
+            daily_product_sales.c.day,
+            daily_product_sales.c.units,
+        ).where(daily_product_sales.c.day.between(start_date, end_date))
+    ).all()
+
+    first_day = np.datetime64(start_date, "D")
+    sales = np.zeros((len(product_ids), days))
+    if rows and len(product_ids):
+        sold_ids, sold_days, units = (np.array(column) for column in zip(*rows))
+        offsets = (sold_days.astype("datetime64[D]") - first_day).astype(np.int64)
+        positions = np.minimum(np.searchsorted(product_ids, sold_ids), len(product_ids) - 1)
+        # Sales of products that have been deleted since are dropped
+        known = product_ids[positions] == sold_ids
+        np.add.at(sales, (positions[known], offsets[known]), units[known])
+
+    return SalesMatrix(product_ids, first_day + np.arange(days), sales)
+
+
+# Function to find the products that will run out within the lead time.
+# Velocity is the average daily units over the whole window, or over the
+# last `recent_days` when that is higher so a rising trend is not missed.
+# Days of stock is the quantity on hand divided by that velocity, and the
+# reorder point is the stock needed to cover lead time plus safety days.
+# Products that did not sell in the window are left out.
+def get_reorder_soon_products(
+    session, window_days=28, recent_days=7, lead_time_days=7, safety_days=3, as_of=None, limit=None
+):
+    np = _numpy()
+    matrix = load_sales_matrix(session, window_days, as_of)
+    average = matrix.moving_average(window_days)[:, -1]
+    recent = matrix.recent_average(min(recent_days, window_days))
+    velocity = np.maximum(average, recent)
+
+    stock = dict(session.execute(select(Product.id, Product.quantity)).all())
+    quantity = np.array(
+        [stock.get(int(product_id)) or 0 for product_id in matrix.product_ids], dtype=np.float64
+    )
+    with np.errstate(divide="ignore"):
+        days_of_stock = np.where(velocity > 0, quantity / velocity, np.inf)
+    reorder_point = np.ceil(velocity * (lead_time_days + safety_days))
+
+    due = np.flatnonzero((velocity > 0) & (days_of_stock <= lead_time_days + safety_days))
+    due = due[np.argsort(days_of_stock[due], kind="stable")]
+    if limit is not None:
+        due = due[:limit]
+
+    details = {
+        row.id: row
+        for row in session.execute(
+            select(Product.id, Product.name, Product.brand).where(
+                Product.id.in_([int(product_id) for product_id in matrix.product_ids[due]])
+            )
+        )
+    }
+    return [
+        ReorderLine(
+            id=int(matrix.product_ids[index]),
+            name=details[int(matrix.product_ids[index])].name,
+            brand=details[int(matrix.product_ids[index])].brand,
+            quantity=int(quantity[index]),
+            avg_daily_units=round(float(average[index]), 2),
+            recent_daily_units=round(float(recent[index]), 2),
+            days_of_stock=round(float(days_of_stock[index]), 1),
+            reorder_point=int(reorder_point[index]),
+        )
+        for index in due
+    ]
@@ -0,0 +1,211 @@
+import asyncio
+import datetime
+import json
+
+import click
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from config import build_async_engine
+from journal import journal_from_settings
+from models import (
+    engine,
+    settings,
+    ensure_schema,
+    as_record,
+    add_product,
+    update_product,
+    delete_product,
+    list_products,
+    search_products,
+    get_low_stock_products,
+    get_stock_alerts,
+    get_most_sold_products,
+    get_least_sold_products,
+    get_never_sold_products,
+    get_products_purchased_in_date_range,
+    purchase,
+    purchase_cart,
+    PurchaseError,
+)
+
+# Request arguments that carry a date, sent as YYYY-MM-DD strings
+DATE_ARGUMENTS = {"start_date", "end_date", "since", "order_date"}
+
+
+# Product, order and report operations as coroutines on one async engine.
+# Each call opens a short AsyncSession and runs the existing function from
+# models.py through run_sync, so the SQL is exactly the same as the CLI's
+# while the event loop keeps serving other requests during database I/O.
+#
+# With an order journal (journal.py), purchases are acknowledged once they
+# are journaled and return {"journal_seq": n} instead of the order id; the
+# journal applies them to the database in group commits.
+class ProductService:
+    def __init__(self, engine=None, journal=None):
+        self.engine = engine or build_async_engine()
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.journal = journal
+
+    async def create_schema(self):
+        async with self.engine.begin() as connection:
+            await connection.run_sync(ensure_schema)
+        if self.journal is not None:
+            await asyncio.to_thread(self.journal.start)
+
+    async def close(self):
+        if self.journal is not None:
+            await asyncio.to_thread(self.journal.stop)
+        await self.engine.dispose()
+
+    async def _journal(self, customer_id, lines, order_date):
+        seq = await asyncio.to_thread(self.journal.purchase, customer_id, lines, order_date)
+        return {"journal_seq": seq}
+
+    async def _run(self, function, *args, **kwargs):
+        async with self.sessions() as session:
+            result = await session.run_sync(function, *args, **kwargs)
+        if isinstance(result, list):
+            return [as_record(row) for row in result]
+        return result
+
+    async def add_product(self, name, brand, price, quantity, reorder_threshold=None):
+        return await self._run(add_product, name, brand, price, quantity, reorder_threshold)
+
+    async def update_product(self, product_id, add_quantity=0, **changes):
+        return await self._run(update_product, product_id, add_quantity, **changes)
+
+    async def delete_product(self, product_id):
+        return await self._run(delete_product, product_id)
+
+    async def list_products(self, page_size=100, after_id=0):
+        return await self._run(list_products, page_size, after_id)
+
+    async def search_products(self, query, page_size=20, page=1):
+        return await self._run(search_products, query, page_size, page)
+
+    async def low_stock(self, limit=None):
+        return await self._run(get_low_stock_products, limit)
+
+    async def stock_alerts(self, after_id=0, limit=100):
+        return await self._run(get_stock_alerts, after_id, limit)
+
+    async def purchase(self, customer_id, product_id, qty, order_date=None):
+        if self.journal is not None:
+            return await self._journal(customer_id, [(product_id, qty)], order_date)
+        return await self._run(purchase, customer_id, product_id, qty, order_date)
+
+    async def purchase_cart(self, customer_id, lines, order_date=None):
+        if self.journal is not None:
+            return await self._journal(customer_id, lines, order_date)
+        return await self._run(purchase_cart, customer_id, lines, order_date)
+
+    async def most_sold(self, limit=10, start_date=None, end_date=None):
+        return await self._run(get_most_sold_products, limit, start_date, end_date)
+
+    async def least_sold(self, limit=10, start_date=None, end_date=None):
+        return await self._run(get_least_sold_products, limit, start_date, end_date)
+
+    async def never_sold(self, since=None, page_size=None, after_id=0):
+        return await self._run(get_never_sold_products, since, page_size, after_id)
+
+    async def date_range(self, start_date=None, end_date=None, group_by=None):
+        return await self._run(
+            _read_all, get_products_purchased_in_date_range, start_date, end_date, group_by
+        )
+
+
+# Run a report that streams its rows and read them all, inside run_sync
+# while the session is still open
+def _read_all(session, function, *args):
+    return function(session, *args).all()
+
+
+# Operations a client may call, by request "op" name
+OPERATIONS = {
+    "product.add": "add_product",
+    "product.update": "update_product",
+    "product.delete": "delete_product",
+    "product.list": "list_products",
+    "product.search": "search_products",
+    "product.low_stock": "low_stock",
+    "product.stock_alerts": "stock_alerts",
+    "order.create": "purchase",
+    "order.create_cart": "purchase_cart",
+    "report.most_sold": "most_sold",
+    "report.least_sold": "least_sold",
+    "report.never_sold": "never_sold",
+    "report.range": "date_range",
+}
+
+
+# Function to answer one JSON request: {"id": 1, "op": "order.create",
+# "args": {...}} gets {"id": 1, "ok": true, "result": ...} back, or
+# {"id": 1, "ok": false, "error": "..."} when it fails
+async def handle_request(service, request):
+    request_id = request.get("id") if isinstance(request, dict) else None
+    try:
+        method = getattr(service, OPERATIONS[request["op"]])
+        args = dict(request.get("args") or {})
+        for name in DATE_ARGUMENTS & args.keys():
+            if args[name] is not None:
+                args[name] = datetime.date.fromisoformat(args[name])
+        result = await method(**args)
+    except KeyError as error:
+        return {"id": request_id, "ok": False, "error": f"Unknown or missing field: {error}"}
+    except (PurchaseError, TypeError, ValueError) as error:
+        return {"id": request_id, "ok": False, "error": str(error)}
+    except Exception as error:
+        # Keep serving other requests, e.g. after a "database is locked"
+        return {"id": request_id, "ok": False, "error": f"{type(error).__name__}: {error}"}
+    return {"id": request_id, "ok": True, "result": result}
+
+
+# Serve newline-delimited JSON requests on a TCP socket. Requests from one
+# connection are handled concurrently and answered as they finish, so
+# clients match responses to requests by "id".
+async def serve(service, host, port):
+    async def handle_connection(reader, writer):
+        write_lock = asyncio.Lock()
+        pending = set()
+
+        async def answer(line):
+            try:
+                response = await handle_request(service, json.loads(line))
+            except ValueError:
+                response = {"id": None, "ok": False, "error": "Invalid JSON"}
+            async with write_lock:
+                writer.write((json.dumps(response, default=str) + "\n").encode("utf-8"))
+                await writer.drain()
+
+        while line := await reader.readline():
+            task = asyncio.create_task(answer(line))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        await asyncio.gather(*pending)
+        writer.close()
+
+    await service.create_schema()
+    try:
+        server = await asyncio.start_server(handle_connection, host, port)
+        click.echo(f"Listening on {host}:{port}", err=True)
+        async with server:
+            await server.serve_forever()
+    finally:
+        # Flushes the order journal, if there is one
+        await service.close()
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", type=int, default=8765, show_default=True)
+def main(host, port):
+    """Serve the product and order operations as JSON over TCP."""
+    service = ProductService(journal=journal_from_settings(settings, engine))
+    try:
+        asyncio.run(serve(service, host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
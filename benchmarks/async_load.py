@@ -0,0 +1,85 @@
+import asyncio
+import json
+import random
+import statistics
+import time
+
+import click
+
+# Mix of operations sent by each simulated client, with relative weights
+OPERATION_MIX = {
+    "order.create": 5,
+    "product.list": 3,
+    "report.most_sold": 1,
+    "report.never_sold": 1,
+}
+
+
+# Arguments for a randomly chosen request
+def make_request(request_id, rng, products, customers):
+    op = rng.choices(list(OPERATION_MIX), weights=list(OPERATION_MIX.values()))[0]
+    if op == "order.create":
+        args = {"customer_id": rng.randint(1, customers), "product_id": rng.randint(1, products), "qty": 1}
+    elif op == "product.list":
+        args = {"page_size": 50, "after_id": rng.randint(0, products)}
+    elif op == "report.most_sold":
+        args = {"limit": 10}
+    else:
+        args = {"page_size": 50}
+    return {"id": request_id, "op": op, "args": args}
+
+
+# One client: send requests one after another, recording each latency
+async def run_client(host, port, requests, rng, products, customers, latencies, failures):
+    reader, writer = await asyncio.open_connection(host, port)
+    for request_id in range(requests):
+        request = make_request(request_id, rng, products, customers)
+        started = time.perf_counter()
+        writer.write((json.dumps(request) + "\n").encode("utf-8"))
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - started)
+        if not response["ok"]:
+            failures[response["error"]] = failures.get(response["error"], 0) + 1
+    writer.close()
+    await writer.wait_closed()
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", type=int, default=8765, show_default=True)
+@click.option("--clients", type=int, default=50, show_default=True)
+@click.option("--requests", type=int, default=200, show_default=True, help="Requests per client.")
+@click.option("--products", type=int, default=1000, show_default=True, help="Highest product id to order.")
+@click.option("--customers", type=int, default=100, show_default=True)
+@click.option("--seed", type=int, default=42, show_default=True)
+def main(host, port, clients, requests, products, customers, seed):
+    """Drive a running async_service.py with many concurrent clients."""
+    latencies, failures = [], {}
+
+    async def run_all():
+        await asyncio.gather(
+            *(
+                run_client(host, port, requests, random.Random(seed + n), products, customers, latencies, failures)
+                for n in range(clients)
+            )
+        )
+
+    started = time.perf_counter()
+    asyncio.run(run_all())
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    click.echo(f"{len(latencies)} requests from {clients} clients in {elapsed:.2f}s")
+    click.echo(f"throughput: {len(latencies) / elapsed:,.0f} requests/sec")
+    click.echo(
+        f"latency ms: median {statistics.median(latencies) * 1000:.2f}, "
+        f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.2f}, "
+        f"max {latencies[-1] * 1000:.2f}"
+    )
+    for error, count in sorted(failures.items(), key=lambda item: -item[1]):
+        click.echo(f"failed {count}x: {error}")
+
+
+if __name__ == "__main__":
+    main()
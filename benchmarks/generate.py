@@ -0,0 +1,93 @@
+import datetime
+import math
+import random
+from itertools import accumulate
+
+from sqlalchemy import insert
+
+from models import Base, orders, Product, Customer, rebuild_daily_sales
+
+BRANDS = ["Nike", "Samsung", "Hisense", "Delmonte", "Gucci", "Apple", "Bic", "Sony"]
+NAMES = ["shoes", "tv set", "phone", "fruits", "clothes", "pen", "laptop", "radio"]
+
+
+# Cumulative weights for a Zipf distribution over n ranks: the product at
+# rank r is bought in proportion to 1 / r**exponent
+def zipf_cum_weights(n, exponent=1.1):
+    return list(accumulate(1 / rank**exponent for rank in range(1, n + 1)))
+
+
+# Cumulative weights for every day between start and end, with a yearly
+# seasonal wave and a December peak so date-range reports see uneven data
+def seasonal_cum_weights(days):
+    weights = []
+    for day in days:
+        season = 1 + 0.4 * math.sin(2 * math.pi * day.timetuple().tm_yday / 365)
+        weights.append(season * (2.0 if day.month == 12 else 1.0))
+    return list(accumulate(weights))
+
+
+# Yield lists of at most `size` generated rows
+def _chunks(make_row, count, size=10000):
+    for start in range(0, count, size):
+        yield [make_row(index) for index in range(start, min(count, start + size))]
+
+
+# Function to fill an empty database with a reproducible synthetic dataset.
+# Product popularity is Zipfian (a few products take most orders, and
+# shuffling keeps popularity independent of id) and order dates follow a
+# seasonal curve over `years` years ending today.
+def generate(engine, products, customers, order_count, seed=42, years=2):
+    rng = random.Random(seed)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    with engine.begin() as connection:
+        for chunk in _chunks(
+            lambda i: {
+                "id": i + 1,
+                "name": f"{rng.choice(NAMES)} {i + 1}",
+                "brand": rng.choice(BRANDS),
+                "price": rng.randint(50, 200000),
+                "quantity": rng.randint(0, 500),
+            },
+            products,
+        ):
+            connection.execute(insert(Product.__table__), chunk)
+
+        for chunk in _chunks(
+            lambda i: {
+                "id": i + 1,
+                "name": f"Customer {i + 1}",
+                "email": f"customer{i + 1}@example.com",
+                "username": f"customer{i + 1}",
+                "role": "user",
+            },
+            customers,
+        ):
+            connection.execute(insert(Customer.__table__), chunk)
+
+        product_ids = list(range(1, products + 1))
+        rng.shuffle(product_ids)
+        popularity = zipf_cum_weights(products)
+        end = datetime.date.today()
+        days = [end - datetime.timedelta(days=n) for n in range(365 * years)]
+        seasons = seasonal_cum_weights(days)
+
+        for chunk in _chunks(lambda i: i, order_count):
+            picked_products = rng.choices(product_ids, cum_weights=popularity, k=len(chunk))
+            picked_days = rng.choices(days, cum_weights=seasons, k=len(chunk))
+            connection.execute(
+                insert(orders),
+                [
+                    {
+                        "customer_id": rng.randint(1, customers),
+                        "product_id": product_id,
+                        "order_date": day,
+                        "quantity": rng.randint(1, 5),
+                    }
+                    for product_id, day in zip(picked_products, picked_days)
+                ],
+            )
+
+        rebuild_daily_sales(connection)
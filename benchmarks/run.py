@@ -0,0 +1,259 @@
+import csv
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from types import SimpleNamespace
+
+import click
+import sqlalchemy
+from sqlalchemy import update
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.generate import generate
+from config import build_engine, load_settings
+from importer import import_products
+from journal import OrderJournal
+from parallel import get_parallel_sales_ranking
+from models import (
+    Product,
+    get_most_sold_products,
+    get_least_sold_products,
+    get_never_sold_products,
+    get_products_purchased_in_date_range,
+    get_low_stock_products,
+    invalidate_products,
+    iter_products,
+    purchase,
+    purchase_carts,
+    sales_ranking_query,
+)
+
+SCENARIOS = {}
+
+
+# Register a benchmark scenario. A scenario takes the run context and may
+# return the number of operations it performed, which turns into ops/sec.
+def scenario(name):
+    def register(function):
+        SCENARIOS[name] = function
+        return function
+
+    return register
+
+
+@scenario("report.most_sold")
+def bench_most_sold(ctx):
+    get_most_sold_products(ctx.session, 10)
+
+
+@scenario("report.most_sold_orders_scan")
+def bench_most_sold_orders_scan(ctx):
+    ctx.session.execute(sales_ranking_query(True, 10, use_rollup=False)).all()
+
+
+@scenario("report.most_sold_parallel")
+def bench_most_sold_parallel(ctx):
+    get_parallel_sales_ranking(ctx.session, True, 10)
+
+
+@scenario("report.least_sold")
+def bench_least_sold(ctx):
+    get_least_sold_products(ctx.session, 10)
+
+
+@scenario("report.never_sold")
+def bench_never_sold(ctx):
+    get_never_sold_products(ctx.session)
+
+
+@scenario("report.date_range_30d")
+def bench_date_range(ctx):
+    end = datetime.date.today()
+    get_products_purchased_in_date_range(ctx.session, end - datetime.timedelta(days=30), end).all()
+
+
+@scenario("product.low_stock")
+def bench_low_stock(ctx):
+    get_low_stock_products(ctx.session)
+
+
+@scenario("product.list")
+def bench_product_list(ctx):
+    return sum(1 for _ in iter_products(ctx.session, 1000))
+
+
+@scenario("order.purchase")
+def bench_purchase(ctx):
+    for _ in range(ctx.purchases):
+        purchase(ctx.session, ctx.rng.randint(1, ctx.customers), ctx.rng.randint(1, ctx.products), 1)
+    return ctx.purchases
+
+
+@scenario("order.purchase_carts")
+def bench_purchase_carts(ctx):
+    carts = [
+        (ctx.rng.randint(1, ctx.customers), [(ctx.rng.randint(1, ctx.products), 1) for _ in range(4)], None)
+        for _ in range(ctx.purchases // 4)
+    ]
+    purchase_carts(ctx.session, carts)
+    return len(carts) * 4
+
+
+@scenario("order.journal")
+def bench_journal(ctx):
+    journal = OrderJournal(os.path.join(ctx.workdir, "orders.journal"), ctx.engine).start()
+    for _ in range(ctx.purchases):
+        journal.purchase(ctx.rng.randint(1, ctx.customers), [(ctx.rng.randint(1, ctx.products), 1)])
+    journal.stop()
+    return ctx.purchases
+
+
+@scenario("import.products")
+def bench_import(ctx):
+    written, _ = import_products(ctx.engine, ctx.import_path, batch_size=5000)
+    return written
+
+
+# Write a products CSV for the import scenario
+def write_import_file(path, rows, rng):
+    with open(path, "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["id", "name", "brand", "price", "quantity"])
+        for index in range(rows):
+            writer.writerow(["", f"imported {index}", "Bench", rng.randint(50, 5000), 100])
+
+
+# Current commit, so result files can be matched to the code they measured
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.group()
+def bench():
+    """PMS benchmark suite."""
+
+
+@bench.command()
+@click.option("--products", type=int, default=10000, show_default=True)
+@click.option("--customers", type=int, default=1000, show_default=True)
+@click.option("--orders", "order_count", type=int, default=200000, show_default=True)
+@click.option("--purchases", type=int, default=1000, show_default=True)
+@click.option("--import-rows", type=int, default=20000, show_default=True)
+@click.option("--repeat", type=int, default=5, show_default=True)
+@click.option("--seed", type=int, default=42, show_default=True)
+@click.option("--scenario", "selected", multiple=True, help="Only run these scenarios.")
+@click.option("--database", default=None, help="SQLite file to generate the dataset in (default: a temp file). Every table in it is dropped first.")
+@click.option("--force", is_flag=True, help="Allow --database to name a file that already exists.")
+@click.option("--output", type=click.Path(dir_okay=False), default="bench_results.json", show_default=True)
+def run(products, customers, order_count, purchases, import_rows, repeat, seed, selected, database, force, output):
+    """Generate a dataset, time every scenario and write the results as JSON."""
+    if database and os.path.exists(database) and not force:
+        raise click.UsageError(
+            f"{database} already exists and its tables would be dropped, pass --force to use it."
+        )
+    workdir = tempfile.mkdtemp(prefix="pms-bench-")
+    database = database or os.path.join(workdir, "bench.db")
+    engine = build_engine(dict(load_settings(), database_url=f"sqlite:///{database}"))
+
+    started = time.perf_counter()
+    generate(engine, products, customers, order_count, seed)
+    click.echo(f"Generated dataset in {time.perf_counter() - started:.1f}s", err=True)
+
+    # Keep the purchase scenario from running out of stock, and give every
+    # tenth product a reorder threshold for the low stock scenarios
+    with engine.begin() as connection:
+        connection.execute(update(Product).values(quantity=Product.quantity + purchases * repeat))
+        connection.execute(
+            update(Product)
+            .where(Product.id % 10 == 0)
+            .values(reorder_threshold=purchases * repeat + 250)
+        )
+
+    rng = random.Random(seed)
+    import_path = os.path.join(workdir, "products.csv")
+    write_import_file(import_path, import_rows, rng)
+    ctx = SimpleNamespace(
+        engine=engine,
+        session=sessionmaker(bind=engine)(),
+        rng=rng,
+        products=products,
+        customers=customers,
+        purchases=purchases,
+        import_path=import_path,
+        workdir=workdir,
+    )
+
+    results = {}
+    for name, function in SCENARIOS.items():
+        if selected and name not in selected:
+            continue
+        timings, operations = [], None
+        for _ in range(repeat):
+            # Start from cold product caches, or every repeat after the
+            # first would only time a cache lookup
+            invalidate_products()
+            started = time.perf_counter()
+            operations = function(ctx)
+            timings.append(time.perf_counter() - started)
+            # End any read transaction the scenario left open
+            ctx.session.rollback()
+        result = {
+            "min": min(timings),
+            "median": statistics.median(timings),
+            "max": max(timings),
+        }
+        if operations:
+            result["ops_per_sec"] = operations / result["median"]
+        results[name] = result
+        click.echo(f"{name:32} median {result['median'] * 1000:10.2f} ms", err=True)
+    ctx.session.close()
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "products": products,
+            "customers": customers,
+            "orders": order_count,
+            "purchases": purchases,
+            "import_rows": import_rows,
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "results": results,
+    }
+    with open(output, "w") as handle:
+        json.dump(report, handle, indent=2)
+    click.echo(f"Wrote {output}", err=True)
+
+
+@bench.command()
+@click.argument("baseline", type=click.File())
+@click.argument("candidate", type=click.File())
+def compare(baseline, candidate):
+    """Compare the median timings of two result files."""
+    old, new = json.load(baseline), json.load(candidate)
+    click.echo(f"{'scenario':32} {'baseline ms':>12} {'candidate ms':>12} {'change':>8}")
+    for name, result in new["results"].items():
+        if name not in old["results"]:
+            continue
+        before, after = old["results"][name]["median"], result["median"]
+        change = (after - before) / before * 100 if before else 0.0
+        click.echo(f"{name:32} {before * 1000:12.2f} {after * 1000:12.2f} {change:+7.1f}%")
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# In-process LRU cache with a time-to-live, for records that are read far
+# more often than they change. Writers call invalidate()/clear(); the TTL
+# bounds how stale an entry can get when another process did the write.
+class RecordCache:
+    def __init__(self, max_size=10000, ttl=60, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Return the live value for key, or _MISSING
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= now:
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    # Read-through lookup: load(key) runs on a miss, and None is not cached
+    def get(self, key, load):
+        with self._lock:
+            value = self._lookup(key, self.clock())
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = load(key)
+        if value is not None:
+            self.put(key, value)
+        return value
+
+    # Bulk read-through: load_many(missing_keys) returns {key: value} for the
+    # keys it found, fetched together instead of one query per key
+    def get_many(self, keys, load_many):
+        found, missing = {}, []
+        with self._lock:
+            now = self.clock()
+            for key in keys:
+                value = self._lookup(key, now)
+                if value is _MISSING:
+                    missing.append(key)
+                else:
+                    found[key] = value
+            self.hits += len(found)
+            self.misses += len(missing)
+        if missing:
+            loaded = load_many(missing)
+            for key, value in loaded.items():
+                self.put(key, value)
+            found.update(loaded)
+        return found
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_MISSING = object()
@@ -0,0 +1,198 @@
+import os
+from configparser import ConfigParser
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+# Settings and their defaults. Each one can be set in the [pms] section of
+# an INI file (PMS_CONFIG, or pms.ini in the working directory) and is
+# overridden by an environment variable named PMS_<SETTING>, for example
+# PMS_DATABASE_URL=postgresql://pms@localhost/pms.
+DEFAULTS = {
+    "database_url": "sqlite:///many.db",
+    # Connection pool, used for server databases such as Postgres
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_timeout": 30,
+    "pool_recycle": 1800,
+    # SQLite pragmas applied to every new connection
+    "sqlite_journal_mode": "WAL",
+    "sqlite_synchronous": "NORMAL",
+    "sqlite_cache_size": -65536,  # negative means KiB, so 64 MiB
+    "sqlite_mmap_size": 268435456,  # 256 MiB
+    "sqlite_busy_timeout": 5000,  # milliseconds
+    # In-process product cache (entries, seconds); a size of 0 disables it
+    "product_cache_size": 10000,
+    "product_cache_ttl": 60,
+    # Keep report results in the report_results table as well as in memory
+    "report_cache_persist": 1,
+    # Write-behind order journal used by the long running servers; an empty
+    # path keeps purchases committing straight to the database. Set fsync to
+    # 1 to make every acknowledged order survive a power loss as well.
+    "order_journal": "",
+    "order_journal_flush_ms": 50,
+    "order_journal_flush_size": 500,
+    "order_journal_fsync": 0,
+}
+
+CONFIG_FILE = "pms.ini"
+
+JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
+# Function to read the settings from the config file and the environment
+def load_settings(environ=None, path=None):
+    environ = os.environ if environ is None else environ
+    settings = dict(DEFAULTS)
+
+    path = path or environ.get("PMS_CONFIG") or (CONFIG_FILE if os.path.exists(CONFIG_FILE) else None)
+    if path:
+        parser = ConfigParser()
+        if not parser.read(path):
+            raise FileNotFoundError(f"Config file not found: {path}")
+        if parser.has_section("pms"):
+            settings.update(
+                (key, value) for key, value in parser.items("pms") if key in DEFAULTS
+            )
+
+    for key in DEFAULTS:
+        variable = f"PMS_{key.upper()}"
+        if variable in environ:
+            settings[key] = environ[variable]
+
+    # Values from files and the environment are strings
+    for key, default in DEFAULTS.items():
+        if isinstance(default, int):
+            settings[key] = int(settings[key])
+
+    # These are interpolated into PRAGMA statements, so only allow known values
+    settings["sqlite_journal_mode"] = settings["sqlite_journal_mode"].upper()
+    settings["sqlite_synchronous"] = settings["sqlite_synchronous"].upper()
+    if settings["sqlite_journal_mode"] not in JOURNAL_MODES:
+        raise ValueError(f"Unknown sqlite_journal_mode: {settings['sqlite_journal_mode']}")
+    if settings["sqlite_synchronous"] not in SYNCHRONOUS_MODES:
+        raise ValueError(f"Unknown sqlite_synchronous: {settings['sqlite_synchronous']}")
+    return settings
+
+
+# Run the configured PRAGMAs on each new SQLite connection
+def _apply_sqlite_pragmas(engine, settings):
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {settings['sqlite_busy_timeout']:d}")
+        cursor.execute(f"PRAGMA journal_mode = {settings['sqlite_journal_mode']}")
+        cursor.execute(f"PRAGMA synchronous = {settings['sqlite_synchronous']}")
+        cursor.execute(f"PRAGMA cache_size = {settings['sqlite_cache_size']:d}")
+        cursor.execute(f"PRAGMA mmap_size = {settings['sqlite_mmap_size']:d}")
+        cursor.close()
+
+
+# Let SQLAlchemy, not the sqlite3 driver, decide where transactions start.
+# The driver only emits BEGIN before an INSERT/UPDATE/DELETE, so a SAVEPOINT
+# issued first would open the transaction itself and its RELEASE would commit
+# everything so far. This is SQLAlchemy's documented recipe for pysqlite.
+def _use_explicit_transactions(engine):
+    @event.listens_for(engine, "connect")
+    def disable_driver_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+
+# Function to build the engine for the given settings. SQLite gets WAL
+# journaling, synchronous=NORMAL, a page cache, memory-mapped I/O and a busy
+# timeout so concurrent writers wait instead of failing with "database is
+# locked". Other databases get a sized QueuePool.
+def build_engine(settings=None):
+    settings = settings or load_settings()
+    url = settings["database_url"]
+
+    if url.startswith("sqlite"):
+        engine = create_engine(
+            url, connect_args={"timeout": settings["sqlite_busy_timeout"] / 1000}
+        )
+        _apply_sqlite_pragmas(engine, settings)
+        _use_explicit_transactions(engine)
+        return engine
+
+    return create_engine(
+        url,
+        poolclass=QueuePool,
+        pool_size=settings["pool_size"],
+        max_overflow=settings["max_overflow"],
+        pool_timeout=settings["pool_timeout"],
+        pool_recycle=settings["pool_recycle"],
+        pool_pre_ping=True,
+    )
+
+
+# Function to build an engine whose connections cannot write, for report
+# workers. SQLite files are opened with mode=ro, so readers never take a
+# write lock; other databases get read-only transactions.
+def build_read_only_engine(settings=None):
+    settings = settings or load_settings()
+    url = make_url(settings["database_url"])
+
+    if url.get_backend_name() == "sqlite":
+        url = url.set(database=f"file:{url.database}", query=dict(url.query, mode="ro", uri="true"))
+        engine = create_engine(
+            url, connect_args={"timeout": settings["sqlite_busy_timeout"] / 1000}
+        )
+
+        @event.listens_for(engine, "connect")
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f"PRAGMA cache_size = {settings['sqlite_cache_size']:d}")
+            cursor.execute(f"PRAGMA mmap_size = {settings['sqlite_mmap_size']:d}")
+            cursor.close()
+
+        return engine
+
+    engine = create_engine(url, pool_size=1, max_overflow=0, pool_pre_ping=True)
+
+    @event.listens_for(engine, "connect")
+    def set_read_only(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+        cursor.close()
+
+    return engine
+
+
+# Async drivers used for each backend by build_async_engine
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+# Function to build an asyncio engine for the same settings, swapping the
+# URL's driver for its async counterpart (aiosqlite / asyncpg). The SQLite
+# PRAGMAs and the pool sizing are the same as for build_engine.
+def build_async_engine(settings=None):
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    settings = settings or load_settings()
+    url = make_url(settings["database_url"])
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS:
+        url = url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+    if backend == "sqlite":
+        engine = create_async_engine(
+            url, connect_args={"timeout": settings["sqlite_busy_timeout"] / 1000}
+        )
+        _apply_sqlite_pragmas(engine.sync_engine, settings)
+        _use_explicit_transactions(engine.sync_engine)
+        return engine
+
+    return create_async_engine(
+        url,
+        pool_size=settings["pool_size"],
+        max_overflow=settings["max_overflow"],
+        pool_timeout=settings["pool_timeout"],
+        pool_recycle=settings["pool_recycle"],
+        pool_pre_ping=True,
+    )
@@ -0,0 +1,137 @@
+import contextlib
+import io
+import os
+import shlex
+import socket
+import socketserver
+import sys
+import threading
+
+import click
+
+# Marks the end of one response on the socket protocol
+END_OF_RESPONSE = "\0"
+
+# Commands that need a terminal of their own and cannot run inside the shell
+INTERACTIVE_COMMANDS = {"menu", "shell", "serve"}
+
+EXIT_WORDS = {"exit", "quit"}
+
+
+# Function to run one command line against the click group in this process.
+# The session is passed in as the context object so every command reuses
+# the same engine, connection pool and compiled statement cache.
+def run_command(group, session, line):
+    try:
+        args = shlex.split(line)
+    except ValueError as error:
+        click.echo(f"Error: {error}", err=True)
+        return 2
+    if not args:
+        return 0
+    if args[0] in INTERACTIVE_COMMANDS:
+        click.echo(f"Error: {args[0]} cannot be run from the shell.", err=True)
+        return 2
+
+    # Tells commands that run until interrupted, such as product
+    # watch-stock, that they would hold the shell or server for good
+    session.info["in_shell"] = True
+    try:
+        result = group.main(
+            args=args, obj=session, prog_name=group.name, standalone_mode=False
+        )
+        return result if isinstance(result, int) else 0
+    except click.ClickException as error:
+        error.show()
+        return error.exit_code
+    except click.exceptions.Abort:
+        click.echo("Aborted!", err=True)
+        return 1
+    except Exception as error:
+        # Keep the long running process alive and the session usable
+        click.echo(f"Error: {error}", err=True)
+        return 1
+    finally:
+        # Every write commits itself; end the read transaction as well so
+        # the next command sees what other processes have committed since
+        session.rollback()
+
+
+# Function to read commands from stdin, one per line, until EOF or "exit"
+def serve_stdin(group, session):
+    interactive = sys.stdin.isatty()
+    while True:
+        if interactive:
+            click.echo("pms> ", nl=False)
+        line = sys.stdin.readline()
+        if not line or line.strip() in EXIT_WORDS:
+            break
+        run_command(group, session, line)
+
+
+# Function to serve commands on a local Unix socket.
+# Each connection gets its own session from the shared engine; commands
+# are run one at a time because their output is captured by swapping
+# sys.stdout and sys.stderr. Every response ends with END_OF_RESPONSE.
+def serve_socket(group, session_factory, socket_path):
+    lock = threading.Lock()
+
+    class CommandHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            session = session_factory()
+            try:
+                for raw_line in self.rfile:
+                    line = raw_line.decode("utf-8").strip()
+                    if line in EXIT_WORDS:
+                        break
+                    output = io.StringIO()
+                    with lock, contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                        run_command(group, session, line)
+                    self.wfile.write(f"{output.getvalue()}{END_OF_RESPONSE}\n".encode("utf-8"))
+            finally:
+                session.close()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socketserver.ThreadingUnixStreamServer(socket_path, CommandHandler)
+    server.daemon_threads = True
+    click.echo(f"Listening on {socket_path}", err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+
+
+# Function to send one command line to a running daemon and return its output
+def send_command(connection, line):
+    connection.sendall(f"{line}\n".encode("utf-8"))
+    response = b""
+    marker = f"{END_OF_RESPONSE}\n".encode("utf-8")
+    while not response.endswith(marker):
+        chunk = connection.recv(65536)
+        if not chunk:
+            break
+        response += chunk
+    return response[: -len(marker)].decode("utf-8")
+
+
+# Thin client: only the standard library and click are imported, so asking
+# the daemon for a report does not pay the SQLAlchemy import cost.
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.option("--socket", "socket_path", default="pms.sock", show_default=True)
+@click.argument("command", nargs=-1, type=click.UNPROCESSED)
+def client(socket_path, command):
+    """Send a command (or stdin lines) to a running `products.py serve`."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        lines = [shlex.join(command)] if command else (line.strip() for line in sys.stdin)
+        for line in lines:
+            if line:
+                click.echo(send_command(connection, line), nl=False)
+
+
+if __name__ == "__main__":
+    client()
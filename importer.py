@@ -0,0 +1,279 @@
+import csv
+import datetime
+import json
+import os
+import time
+from itertools import islice
+
+import click
+from sqlalchemy import insert, select
+
+from models import (
+    engine,
+    ensure_schema,
+    SchemaOutOfDateError,
+    orders,
+    Product,
+    bump_data_version,
+    invalidate_products,
+    record_daily_sales,
+    upsert_insert,
+)
+
+
+# Raised for a row that cannot be imported
+class ImportRowError(ValueError):
+    pass
+
+
+# Stream the rows of a .csv or .jsonl file one at a time as (line number, dict)
+def read_rows(path):
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline="", encoding="utf-8") as handle:
+        if extension == ".csv":
+            for line_no, row in enumerate(csv.DictReader(handle), start=2):
+                yield line_no, row
+        elif extension in (".jsonl", ".ndjson"):
+            for line_no, line in enumerate(handle, start=1):
+                line = line.strip()
+                if line:
+                    try:
+                        yield line_no, json.loads(line)
+                    except ValueError:
+                        yield line_no, None
+        else:
+            raise click.BadParameter(f"Unsupported file type: {extension}")
+
+
+# Convert an optional field to int, treating blanks as missing
+def _optional_int(row, field):
+    value = row.get(field)
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+# Convert a required field to int, rejecting blanks and negative numbers
+def _required_int(row, field):
+    value = _optional_int(row, field)
+    if value is None:
+        raise ImportRowError(f"missing {field}")
+    if value < 0:
+        raise ImportRowError(f"{field} must not be negative")
+    return value
+
+
+# Validate a product row and return the values to insert
+def validate_product(row):
+    name = (row.get("name") or "").strip()
+    if not name:
+        raise ImportRowError("missing name")
+    return {
+        "id": _optional_int(row, "id"),
+        "name": name,
+        "brand": (row.get("brand") or "").strip() or None,
+        "price": _required_int(row, "price"),
+        "quantity": _required_int(row, "quantity"),
+    }
+
+
+# Validate an order row and return the values to insert
+def validate_order(row):
+    order_date = row.get("order_date")
+    if not order_date:
+        raise ImportRowError("missing order_date")
+    try:
+        order_date = datetime.date.fromisoformat(str(order_date))
+    except ValueError:
+        raise ImportRowError(f"invalid order_date {order_date!r}")
+    quantity = _required_int(row, "quantity")
+    if quantity == 0:
+        raise ImportRowError("quantity must be greater than zero")
+    return {
+        "order_id": _optional_int(row, "order_id"),
+        "customer_id": _required_int(row, "customer_id"),
+        "product_id": _required_int(row, "product_id"),
+        "order_date": order_date,
+        "quantity": quantity,
+    }
+
+
+# Validate a stream of rows, reporting and skipping the bad ones
+def valid_rows(rows, validate, errors):
+    for line_no, row in rows:
+        if not isinstance(row, dict):
+            errors.append((line_no, "not a JSON object"))
+            continue
+        try:
+            yield validate(row)
+        except (ImportRowError, ValueError, TypeError) as error:
+            errors.append((line_no, str(error)))
+
+
+# Group an iterable into lists of at most `size` items
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+# Build an INSERT for the table that updates the existing row when the
+# primary key is already taken (SQLite and Postgres), or a plain INSERT.
+# Only the imported columns are updated, so columns the file does not
+# carry (such as a product's reorder threshold) keep their values.
+def _upsert_statement(connection, table, key, columns):
+    statement = upsert_insert(connection, table)
+    if statement is None:
+        return insert(table)
+    updates = {
+        name: statement.excluded[name]
+        for name in columns
+        if name != key
+    }
+    return statement.on_conflict_do_update(index_elements=[key], set_=updates)
+
+
+# Insert the rows whose key is not in the table yet, keeping the first row
+# for a key that repeats, and return the rows that were inserted. Where the
+# database can, this is one INSERT .. ON CONFLICT DO NOTHING RETURNING key;
+# otherwise the taken keys are looked up first.
+def _insert_new_keyed_rows(connection, table, key, keyed):
+    unique = {}
+    for row in keyed:
+        unique.setdefault(row[key], row)
+    rows = list(unique.values())
+
+    statement = upsert_insert(connection, table)
+    if statement is not None and connection.dialect.insert_executemany_returning:
+        statement = statement.on_conflict_do_nothing(index_elements=[key])
+        inserted = set(connection.execute(statement.returning(table.c[key]), rows).scalars())
+        return [row for row in rows if row[key] in inserted]
+
+    existing = set(
+        connection.execute(select(table.c[key]).where(table.c[key].in_(unique))).scalars()
+    )
+    rows = [row for row in rows if row[key] not in existing]
+    if rows:
+        connection.execute(insert(table), rows)
+    return rows
+
+
+# Write validated rows to the table in batches, one transaction per batch.
+# Rows carrying their own key are upserted, rows without one are inserted
+# and numbered by the database. Each batch is a single executemany call.
+# With skip_existing=True, rows whose key is already taken are skipped
+# instead of updated. after_batch(connection, rows) runs inside the batch's
+# transaction with the rows that were written. Returns the number written.
+def bulk_write(bind, table, key, rows, batch_size, after_batch=None, skip_existing=False):
+    written = 0
+    for batch in batched(rows, batch_size):
+        keyed = [row for row in batch if row[key] is not None]
+        unkeyed = [
+            {name: value for name, value in row.items() if name != key}
+            for row in batch
+            if row[key] is None
+        ]
+        with bind.begin() as connection:
+            if keyed and skip_existing:
+                keyed = _insert_new_keyed_rows(connection, table, key, keyed)
+            elif keyed:
+                connection.execute(_upsert_statement(connection, table, key, keyed[0]), keyed)
+            if unkeyed:
+                connection.execute(insert(table), unkeyed)
+            if after_batch is not None and (keyed or unkeyed):
+                after_batch(connection, keyed + unkeyed)
+        written += len(keyed) + len(unkeyed)
+    return written
+
+
+# Function to import products from a file, returning (written, errors)
+def import_products(bind, path, batch_size=5000):
+    errors = []
+    rows = valid_rows(read_rows(path), validate_product, errors)
+    written = bulk_write(
+        bind,
+        Product.__table__,
+        "id",
+        rows,
+        batch_size,
+        after_batch=lambda connection, batch: bump_data_version(connection, "products"),
+    )
+    invalidate_products()
+    return written, errors
+
+
+# Keep the rollup and the data version in step with a batch of imported orders
+def _record_order_batch(connection, batch):
+    record_daily_sales(connection, batch)
+    bump_data_version(connection, "orders")
+
+
+# Function to import orders from a file, returning (written, errors).
+# Imported orders are historical records and do not change product stock,
+# but they are added to the daily sales rollup batch by batch. Orders whose
+# order_id is already in the table are skipped, so importing the same file
+# twice does not count its sales twice in the rollup.
+def import_orders(bind, path, batch_size=5000):
+    errors = []
+    rows = valid_rows(read_rows(path), validate_order, errors)
+    written = bulk_write(
+        bind,
+        orders,
+        "order_id",
+        rows,
+        batch_size,
+        after_batch=_record_order_batch,
+        skip_existing=True,
+    )
+    return written, errors
+
+
+IMPORTERS = {"products": import_products, "orders": import_orders}
+
+
+# Work out which table a file holds from its name, e.g. products.csv
+def guess_table(path):
+    name = os.path.basename(path).lower()
+    for table in IMPORTERS:
+        if name.startswith(table.rstrip("s")):
+            return table
+    return None
+
+
+@click.command(name="import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--table",
+    type=click.Choice(sorted(IMPORTERS)),
+    help="Table to load; guessed from the file name when omitted.",
+)
+@click.option("--batch-size", type=click.IntRange(min=1), default=5000, show_default=True)
+def import_file(path, table, batch_size):
+    """Bulk load products or orders from a .csv or .jsonl file."""
+    table = table or guess_table(path)
+    if table is None:
+        raise click.UsageError("Cannot tell which table the file holds, pass --table.")
+
+    try:
+        with engine.begin() as connection:
+            ensure_schema(connection)
+    except SchemaOutOfDateError as error:
+        raise click.ClickException(str(error))
+    started = time.perf_counter()
+    written, errors = IMPORTERS[table](engine, path, batch_size)
+    elapsed = time.perf_counter() - started
+
+    for line_no, message in errors:
+        click.echo(f"Skipped line {line_no}: {message}", err=True)
+    rate = written / elapsed if elapsed > 0 else float(written)
+    click.echo(
+        f"Imported {written} {table} in {elapsed:.2f}s ({rate:,.0f} rows/sec), "
+        f"skipped {len(errors)} invalid rows."
+    )
+
+
+if __name__ == "__main__":
+    import_file()
@@ -0,0 +1,154 @@
+import bisect
+import logging
+import os
+import time
+from collections import defaultdict
+
+from sqlalchemy import event
+
+# Upper bounds (in milliseconds) of the latency histogram buckets
+BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, float("inf"))
+
+slow_query_log = logging.getLogger("pms.slow_query")
+
+
+# Timing and counts for one distinct SQL statement. rows is the number of
+# rows fetched for a query and the number of rows changed for a write;
+# None when the driver did not say (e.g. executemany on some drivers).
+class StatementStats:
+    def __init__(self):
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = None
+        self.returns_rows = False
+        self.histogram = [0] * len(BUCKETS_MS)
+
+    def record(self, elapsed_ms, rowcount):
+        self.calls += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.histogram[bisect.bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+        if rowcount is not None and rowcount >= 0:
+            self.rows = (self.rows or 0) + rowcount
+
+
+# DBAPI cursor stand-in that adds the rows fetched through it to the stats of
+# its statement. The cursor's rowcount cannot be used for queries: SQLite
+# reports -1 for every SELECT.
+class RowCountingCursor:
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _count(self, rows):
+        self._stats.rows += len(rows)
+        return rows
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        return self._count(self._cursor.fetchmany(*args))
+
+    def fetchall(self):
+        return self._count(self._cursor.fetchall())
+
+
+# Records every statement an engine runs through the before/after cursor
+# execute events. Statements slower than slow_query_ms go to the
+# "pms.slow_query" logger, and a query run n_plus_one_threshold times or more
+# within one command that fetched at most one row per run is reported as a
+# likely N+1 pattern. Paged queries, which fetch whole pages, are not.
+class QueryProfiler:
+    def __init__(self, slow_query_ms=None, n_plus_one_threshold=10):
+        self.slow_query_ms = slow_query_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.statements = defaultdict(StatementStats)
+        self.engine = None
+
+    def attach(self, engine):
+        self.engine = engine
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        return self
+
+    def detach(self):
+        if self.engine is not None:
+            event.remove(self.engine, "before_cursor_execute", self._before_cursor_execute)
+            event.remove(self.engine, "after_cursor_execute", self._after_cursor_execute)
+            self.engine = None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("pms_query_start", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info["pms_query_start"].pop()) * 1000
+        stats = self.statements[statement]
+        if cursor.description is not None and context is not None:
+            # Count the rows as the result fetches them
+            stats.record(elapsed_ms, None)
+            stats.returns_rows = True
+            stats.rows = stats.rows or 0
+            context.cursor = RowCountingCursor(cursor, stats)
+        else:
+            stats.record(elapsed_ms, cursor.rowcount)
+        if self.slow_query_ms is not None and elapsed_ms >= self.slow_query_ms:
+            slow_query_log.warning(
+                "%.1f ms %s%s", elapsed_ms, " ".join(statement.split()),
+                " (executemany)" if executemany else "",
+            )
+
+    # Statements that look like an N+1 pattern in what was recorded so far
+    def n_plus_one_suspects(self):
+        return [
+            (statement, stats.calls)
+            for statement, stats in self.statements.items()
+            if stats.returns_rows
+            and stats.calls >= self.n_plus_one_threshold
+            and stats.rows <= stats.calls
+        ]
+
+    # Human readable summary of the recorded statements, slowest first
+    def summary(self):
+        total_calls = sum(stats.calls for stats in self.statements.values())
+        total_ms = sum(stats.total_ms for stats in self.statements.values())
+        lines = [f"{total_calls} statements, {total_ms:.2f} ms total"]
+        ranked = sorted(self.statements.items(), key=lambda item: item[1].total_ms, reverse=True)
+        for statement, stats in ranked:
+            sql = " ".join(statement.split())
+            rows = "-" if stats.rows is None else stats.rows
+            lines.append(
+                f"  {stats.calls:6d}x {stats.total_ms:9.2f} ms total "
+                f"{stats.max_ms:8.2f} ms max {rows:>8} rows  {sql[:100]}"
+            )
+            lines.append(
+                "          histogram: "
+                + " ".join(
+                    f"<={bound:g}ms:{count}" if bound != float("inf") else f">{BUCKETS_MS[-2]:g}ms:{count}"
+                    for bound, count in zip(BUCKETS_MS, stats.histogram)
+                    if count
+                )
+            )
+        for statement, calls in self.n_plus_one_suspects():
+            lines.append(f"  possible N+1: ran {calls} times: {' '.join(statement.split())[:100]}")
+        return "\n".join(lines)
+
+
+# Send slow query warnings to a file (once per file, however often it is called)
+def log_slow_queries_to(path):
+    for handler in slow_query_log.handlers:
+        if getattr(handler, "baseFilename", None) == os.path.abspath(path):
+            return handler
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    slow_query_log.addHandler(handler)
+    slow_query_log.setLevel(logging.WARNING)
+    slow_query_log.propagate = False
+    return handler
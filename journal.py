@@ -0,0 +1,357 @@
+import datetime
+import fcntl
+import json
+import logging
+import os
+import threading
+from collections import Counter
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import sessionmaker
+
+from models import (
+    Product,
+    journal_checkpoints,
+    OutOfStockError,
+    PurchaseError,
+    existing_customers,
+    purchase_carts,
+    upsert_insert,
+)
+
+journal_log = logging.getLogger("pms.order_journal")
+
+
+# Write-behind order journal. A purchase is appended to a local JSON Lines
+# file and acknowledged once it is there; stock is guarded in memory per
+# product so an accepted order can always be filled. A background thread
+# applies the journaled orders to the database in group commits, every
+# flush_ms milliseconds or as soon as flush_size orders are waiting, which
+# turns a burst of purchases into a few transactions instead of one each.
+#
+# The database stays the source of truth: the last applied entry is
+# checkpointed in journal_checkpoints in the same transaction as the orders,
+# and start() replays whatever the journal holds beyond that checkpoint, so
+# orders accepted before a crash are applied exactly once. The journal is
+# meant to be the only place purchases for this database are made while it
+# runs; restocks from elsewhere are picked up after each flush.
+#
+# Appends are flushed to the operating system before a purchase returns,
+# which survives a crash of the process, like SQLite's synchronous=NORMAL.
+# With fsync=True they are also fsynced, one fsync covering every purchase
+# that arrived while the previous one ran.
+class OrderJournal:
+    def __init__(self, path, bind, flush_ms=50, flush_size=500, fsync=False, compact_every=10000):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.sessions = sessionmaker(bind=bind)
+        self.flush_interval = flush_ms / 1000
+        self.flush_size = flush_size
+        self.fsync = fsync
+        self.compact_every = compact_every
+
+        self.available = {}
+        self.customers = set()
+        self.pending = []
+        self.pending_units = Counter()
+        self.seq = 0
+        self.applied_since_compaction = 0
+        self.stats = Counter()
+
+        self._condition = threading.Condition()
+        self._sync_lock = threading.Lock()
+        self.synced_seq = 0
+        self._stopping = False
+        self._thread = None
+        self._handle = None
+        self._lock_file = None
+
+    # Function to open the journal, replay the entries that never reached
+    # the database and start the flusher thread
+    def start(self):
+        self._lock_file = open(self.path + ".lock", "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise RuntimeError(f"Order journal {self.path} is in use by another process.")
+
+        with self.sessions() as session:
+            checkpoint = read_checkpoint(session, self.name)
+        self.seq = checkpoint
+        for entry in read_journal(self.path):
+            self.seq = max(self.seq, entry["seq"])
+            if entry["seq"] > checkpoint:
+                self.pending.append(entry)
+                self.stats["replayed"] += 1
+                for product_id, qty in entry["lines"]:
+                    self.pending_units[product_id] += qty
+
+        # Load the whole catalog's stock in one query; products added later
+        # are looked up when first ordered
+        with self.sessions() as session:
+            stock = dict(session.execute(select(Product.id, Product.quantity)).all())
+        self._set_stock(stock, stock)
+
+        # Rewrite the journal with just the entries still to apply, which also
+        # drops a torn last line that later appends would otherwise extend
+        self._compact()
+        self._thread = threading.Thread(target=self._run, name="order-journal", daemon=True)
+        self._thread.start()
+        return self
+
+    # Function to stop the flusher after it has applied every pending entry
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+        self._handle.close()
+        self._handle = None
+        self._lock_file.close()
+
+    # Function to accept a purchase of a cart of (product_id, qty) lines.
+    # It is checked against the in-memory stock, appended to the journal
+    # and acknowledged; the database write happens in the next group commit.
+    # Returns the journal sequence number of the entry.
+    def purchase(self, customer_id, lines, order_date=None):
+        wanted = Counter()
+        for product_id, qty in lines:
+            if qty <= 0:
+                raise PurchaseError("Quantity must be greater than zero!")
+            wanted[product_id] += qty
+        if not wanted:
+            raise PurchaseError("The cart is empty!")
+
+        with self._condition:
+            if self._stopping:
+                raise PurchaseError("The order journal is shutting down.")
+            if customer_id not in self.customers:
+                with self.sessions() as session:
+                    self.customers |= existing_customers(session, [customer_id])
+                if customer_id not in self.customers:
+                    raise PurchaseError("Invalid customer ID!")
+            self._load_stock(
+                [product_id for product_id in wanted if product_id not in self.available]
+            )
+            missing = [product_id for product_id in wanted if product_id not in self.available]
+            if missing:
+                raise PurchaseError(f"Invalid product ID: {', '.join(map(str, missing))}")
+            short = [
+                product_id for product_id, qty in wanted.items() if self.available[product_id] < qty
+            ]
+            if short:
+                raise OutOfStockError(
+                    f"Insufficient quantity for product {', '.join(map(str, short))}"
+                )
+
+            self.seq += 1
+            entry = {
+                "seq": self.seq,
+                "customer_id": customer_id,
+                "lines": sorted(wanted.items()),
+                "order_date": (order_date or datetime.date.today()).isoformat(),
+            }
+            self._append(entry)
+            for product_id, qty in wanted.items():
+                self.available[product_id] -= qty
+                self.pending_units[product_id] += qty
+            self.pending.append(entry)
+            self.stats["accepted"] += 1
+            if len(self.pending) >= self.flush_size:
+                self._condition.notify()
+        if self.fsync:
+            self._sync(entry["seq"])
+        return entry["seq"]
+
+    # Function to wait until everything accepted so far is in the database;
+    # returns False if that did not happen within the timeout
+    def flush(self, timeout=None):
+        with self._condition:
+            target = self.seq
+            self._condition.notify()
+            return self._condition.wait_for(
+                lambda: not self.pending or self.pending[0]["seq"] > target, timeout
+            )
+
+    # Fill the stock guard for products not seen yet: what the database
+    # holds minus what is journaled but not yet applied
+    def _load_stock(self, product_ids):
+        if not product_ids:
+            return
+        self._set_stock(product_ids, self._read_stock(product_ids))
+
+    def _read_stock(self, product_ids):
+        with self.sessions() as session:
+            return dict(
+                session.execute(
+                    select(Product.id, Product.quantity).where(Product.id.in_(product_ids))
+                ).all()
+            )
+
+    def _set_stock(self, product_ids, stock):
+        for product_id in product_ids:
+            if product_id in stock:
+                self.available[product_id] = stock[product_id] - self.pending_units[product_id]
+            else:
+                self.available.pop(product_id, None)
+
+    def _append(self, entry):
+        self._handle.write(json.dumps(entry) + "\n")
+        self._handle.flush()
+
+    # Make the journal durable up to seq. Purchases that arrive while one
+    # fsync runs are covered by the next, so concurrent buyers share fsyncs.
+    def _sync(self, seq):
+        with self._sync_lock:
+            if self.synced_seq >= seq:
+                return
+            with self._condition:
+                target = self.seq
+                handle = self._handle
+            try:
+                os.fsync(handle.fileno())
+            except (OSError, ValueError):
+                # A compaction closed the file meanwhile, after syncing the
+                # rewritten journal, so there is nothing left to do
+                if not handle.closed:
+                    raise
+            self.synced_seq = target
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._stopping or len(self.pending) >= self.flush_size,
+                    timeout=self.flush_interval,
+                )
+                batch = list(self.pending)
+                if not batch and self._stopping:
+                    return
+            if batch:
+                try:
+                    self._apply(batch)
+                except Exception:
+                    # Leave the batch pending and try again on the next round
+                    journal_log.exception("Applying %d journaled orders failed", len(batch))
+                    self.stats["failed_flushes"] += 1
+                    if self._stopping:
+                        return
+
+    # Apply a batch of entries in one transaction together with the checkpoint.
+    # Entries at or below the checkpoint were committed by an earlier attempt
+    # that failed after its commit, and are skipped so none is applied twice.
+    def _apply(self, batch):
+        results = []
+        with self.sessions() as session:
+            checkpoint = read_checkpoint(session, self.name)
+            fresh = [entry for entry in batch if entry["seq"] > checkpoint]
+            if fresh:
+                save_checkpoint(session, self.name, fresh[-1]["seq"])
+                results = purchase_carts(
+                    session,
+                    [
+                        (
+                            entry["customer_id"],
+                            entry["lines"],
+                            datetime.date.fromisoformat(entry["order_date"]),
+                        )
+                        for entry in fresh
+                    ],
+                )
+
+        # The batch is in the database: take it off pending before anything
+        # else can fail, so the next round does not pick it up again
+        with self._condition:
+            del self.pending[: len(batch)]
+            for entry in batch:
+                for product_id, qty in entry["lines"]:
+                    self.pending_units[product_id] -= qty
+            self.stats["applied"] += len(fresh)
+            self.stats["flushes"] += 1
+            self.applied_since_compaction += len(batch)
+            if not self.pending or self.applied_since_compaction >= self.compact_every:
+                self._compact()
+            self._condition.notify_all()
+
+        touched = {product_id for entry in batch for product_id, _ in entry["lines"]}
+        for entry, (_, error) in zip(fresh, results):
+            if error is not None:
+                # The database had less stock than the guard expected, e.g.
+                # after a write made without the journal
+                self.stats["rejected"] += 1
+                journal_log.warning("Rejected journaled order %s: %s", json.dumps(entry), error)
+                with open(self.path + ".rejected", "a", encoding="utf-8") as rejected:
+                    rejected.write(json.dumps(dict(entry, error=str(error))) + "\n")
+
+        # Resync the guard with the database, which also picks up restocks
+        stock = self._read_stock(touched)
+        with self._condition:
+            self._set_stock(touched, stock)
+
+    # Rewrite the journal with only the entries still pending, so it does
+    # not grow without bound. Called with the condition held.
+    def _compact(self):
+        if self._handle is not None:
+            self._handle.close()
+        with open(self.path + ".tmp", "w", encoding="utf-8") as handle:
+            for entry in self.pending:
+                handle.write(json.dumps(entry) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(self.path + ".tmp", self.path)
+        self._handle = open(self.path, "a", encoding="utf-8")
+        self.applied_since_compaction = 0
+
+
+# Stream the entries of a journal file. A torn last line, left by a crash
+# in the middle of an append, was never acknowledged and is skipped.
+def read_journal(path):
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                journal_log.warning("Skipping unreadable journal line: %r", line)
+
+
+# Function to read the last applied entry of a journal, 0 when none was
+def read_checkpoint(executor, name):
+    return (
+        executor.execute(
+            select(journal_checkpoints.c.seq).where(journal_checkpoints.c.name == name)
+        ).scalar()
+        or 0
+    )
+
+
+# Function to record the last applied entry of a journal
+def save_checkpoint(executor, name, seq):
+    statement = upsert_insert(executor, journal_checkpoints)
+    if statement is not None:
+        statement = statement.values(name=name, seq=seq)
+        executor.execute(
+            statement.on_conflict_do_update(index_elements=["name"], set_={"seq": seq})
+        )
+        return
+    result = executor.execute(
+        update(journal_checkpoints).where(journal_checkpoints.c.name == name).values(seq=seq)
+    )
+    if result.rowcount == 0:
+        executor.execute(journal_checkpoints.insert().values(name=name, seq=seq))
+
+
+# Function to build the journal configured in the settings, or None when the
+# order_journal setting is empty
+def journal_from_settings(settings, bind):
+    if not settings["order_journal"]:
+        return None
+    return OrderJournal(
+        settings["order_journal"],
+        bind,
+        flush_ms=settings["order_journal_flush_ms"],
+        flush_size=settings["order_journal_flush_size"],
+        fsync=bool(settings["order_journal_fsync"]),
+    )
@@ -1,12 +1,23 @@
-from sqlalchemy import create_engine
-from sqlalchemy import ForeignKey, Table, Column, Integer, String, Date
-from sqlalchemy.orm import relationship, sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import delete
+from sqlalchemy import ForeignKey, Table, Column, Integer, String, Date, DateTime, Float, Index, Text
+from sqlalchemy.orm import relationship
+from sqlalchemy.orm import declarative_base
+from sqlalchemy import bindparam, case, delete, event, func, insert, inspect, or_, select, text, tuple_, update
+from collections import Counter
 import datetime
-import click
+import importlib
+import logging
+import re
+import zlib
 
-engine = create_engine("sqlite:///many.db")
+from cache import RecordCache
+from config import build_engine, load_settings
+
+# Logs data version bumps that failed after their write had committed
+data_version_log = logging.getLogger("pms.data_versions")
+
+# Shared engine, configured from pms.ini / PMS_* environment variables
+settings = load_settings()
+engine = build_engine(settings)
 Base = declarative_base()
 
 # Define the join table "orders"
@@ -18,6 +29,69 @@ orders = Table(
     Column("product_id", ForeignKey("products.id")),
     Column("order_date", Date),
     Column("quantity", Integer),
+    # Composite indexes for the date-range report and per-customer history
+    Index("ix_orders_product_id_order_date", "product_id", "order_date"),
+    Index("ix_orders_customer_id_order_date", "customer_id", "order_date"),
+)
+
+
+# Daily per-product sales rollup, kept up to date as orders are inserted.
+# Revenue is recorded at the price the product had when the order was written,
+# and rebuild_daily_sales keeps it (see there for the exceptions).
+daily_product_sales = Table(
+    "daily_product_sales",
+    Base.metadata,
+    Column("product_id", ForeignKey("products.id"), primary_key=True),
+    Column("day", Date, primary_key=True),
+    Column("units", Integer, nullable=False),
+    Column("revenue", Integer, nullable=False),
+    Column("order_count", Integer, nullable=False, server_default="0"),
+)
+
+# Monotonic version counters, one per kind of data ("orders", "products"),
+# bumped in the same transaction as every write so cached report results
+# can tell whether they are still current, across processes too.
+data_versions = Table(
+    "data_versions",
+    Base.metadata,
+    Column("name", String, primary_key=True),
+    Column("version", Integer, nullable=False),
+)
+
+# Persisted report results, keyed by report name and parameters
+report_results = Table(
+    "report_results",
+    Base.metadata,
+    Column("key", String, primary_key=True),
+    Column("data_version", String, nullable=False),
+    Column("result", Text, nullable=False),
+    Column("computed_at", DateTime, nullable=False),
+    Column("compute_ms", Float, nullable=False),
+)
+
+# Last order journal entry applied to the database, per journal. It is
+# written in the same transaction as the orders, so a replay after a crash
+# skips exactly the entries that were already committed.
+journal_checkpoints = Table(
+    "journal_checkpoints",
+    Base.metadata,
+    Column("name", String, primary_key=True),
+    Column("seq", Integer, nullable=False),
+)
+
+# Reorder threshold crossings, written in the same transaction as the stock
+# change that caused them: kind is "low" when a product drops to or below
+# its threshold and "restocked" when it goes back above it. Readers follow
+# the table by alert_id instead of scanning the catalog.
+stock_alerts = Table(
+    "stock_alerts",
+    Base.metadata,
+    Column("alert_id", Integer, primary_key=True),
+    Column("product_id", ForeignKey("products.id"), nullable=False),
+    Column("kind", String, nullable=False),
+    Column("quantity", Integer, nullable=False),
+    Column("reorder_threshold", Integer, nullable=False),
+    Column("created_at", DateTime, nullable=False),
 )
 
 
@@ -28,210 +102,1026 @@ class Product(Base):
     brand = Column(String())
     price = Column(Integer())
     quantity = Column(Integer())
+    # Stock level at or below which the product needs reordering, or None
+    reorder_threshold = Column(Integer())
     customers = relationship("Customer", secondary=orders, back_populates="products")
 
+    # Partial index holding only the products at or below their threshold.
+    # The database keeps it current as stock changes, so the low stock list
+    # reads just those entries however large the catalog is. The Postgres
+    # condition is added by make_low_stock_index_partial, as naming it here
+    # would import the Postgres dialect along with this module.
+    __table_args__ = (
+        Index(
+            "ix_products_low_stock",
+            "quantity",
+            sqlite_where=quantity <= reorder_threshold,
+        ),
+    )
+
+
+# Give ix_products_low_stock its Postgres condition just before the table is
+# created there; the dialect is loaded by then
+@event.listens_for(Product.__table__, "before_create")
+def make_low_stock_index_partial(target, connection, **kw):
+    if connection.dialect.name == "postgresql":
+        index = next(index for index in target.indexes if index.name == "ix_products_low_stock")
+        index.dialect_options["postgresql"]["where"] = (
+            target.c.quantity <= target.c.reorder_threshold
+        )
+
 
 class Customer(Base):
     __tablename__ = "customers"
     id = Column(Integer(), primary_key=True)
     name = Column(String())
     email = Column(String())
-    username = Column(String())
+    username = Column(String(), index=True, unique=True)
     role = Column(String())
     products = relationship("Product", secondary=orders, back_populates="customers")
 
 
-def get_most_sold_products(session):
-    # Query the database to get the products sorted by the total quantity sold in descending order
-    # Return the sorted list of products
-    products = (
-        session.query(Product)
-        .join(orders)
-        .group_by(Product.id)
-        .order_by(Product.quantity.desc())
-        .all()
+# Full-text index over products.name and products.brand (SQLite FTS5). It
+# is an external content table, so it stores only the index, and triggers
+# keep it in step with every write to products, including bulk imports.
+# Prefix indexes on 2 and 3 characters make "type ahead" lookups cheap.
+PRODUCT_SEARCH_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, brand, content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts (rowid, name, brand) VALUES (new.id, new.name, new.brand);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, name, brand)
+        VALUES ('delete', old.id, old.name, old.brand);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, brand ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, name, brand)
+        VALUES ('delete', old.id, old.name, old.brand);
+        INSERT INTO products_fts (rowid, name, brand) VALUES (new.id, new.name, new.brand);
+    END""",
+)
+
+
+# Create the search index along with the other tables on SQLite, filling
+# it from the products already there when it did not exist yet
+@event.listens_for(Base.metadata, "after_create")
+def create_product_search(target, connection, **kw):
+    if connection.dialect.name != "sqlite":
+        return
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'")
+    ).first()
+    for statement in PRODUCT_SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+    if exists is None:
+        connection.exec_driver_sql("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+
+
+# Fingerprint of the tables, columns and indexes defined here plus the search
+# index DDL, as a positive 32-bit number that fits SQLite's user_version
+def schema_fingerprint():
+    parts = list(PRODUCT_SEARCH_DDL)
+    for table in sorted(Base.metadata.tables.values(), key=lambda table: table.name):
+        parts.append(table.name)
+        parts.extend(
+            f"{column.name} {column.type} {column.nullable} {column.primary_key}"
+            for column in table.columns
+        )
+        parts.extend(sorted(index.name for index in table.indexes))
+    return zlib.crc32("\n".join(parts).encode("utf-8")) & 0x7FFFFFFF
+
+
+# Raised when the database has only part of the schema, e.g. one made by
+# an older version; alembic brings it up to date
+class SchemaOutOfDateError(RuntimeError):
+    pass
+
+
+# Function to list the tables, columns and indexes defined here that the
+# database lacks, as "table", "table.column" and index names
+def missing_schema(connection):
+    inspector = inspect(connection)
+    existing = set(inspector.get_table_names())
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing:
+            missing.append(table.name)
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        missing.extend(
+            f"{table.name}.{column.name}" for column in table.columns if column.name not in columns
+        )
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        missing.extend(index.name for index in table.indexes if index.name not in indexes)
+    if connection.dialect.name == "sqlite" and "products_fts" not in existing:
+        missing.append("products_fts")
+    return missing
+
+
+# Function to create the schema in an empty database. On SQLite the database
+# is stamped with the schema fingerprint in PRAGMA user_version, and the
+# check is skipped while the stamp matches. create_all cannot add columns or
+# indexes to existing tables, so a database holding only part of the schema
+# raises SchemaOutOfDateError instead, to be migrated with alembic; it is
+# stamped only once it matches. Returns whether create_all ran.
+def ensure_schema(connection):
+    is_sqlite = connection.dialect.name == "sqlite"
+    fingerprint = schema_fingerprint()
+    if is_sqlite and connection.exec_driver_sql("PRAGMA user_version").scalar() == fingerprint:
+        return False
+    missing = missing_schema(connection)
+    created = False
+    if set(missing) >= set(Base.metadata.tables):
+        Base.metadata.create_all(connection)
+        created = True
+    elif missing:
+        raise SchemaOutOfDateError(
+            f"The database schema is out of date (missing {', '.join(missing)}). "
+            "Run `alembic upgrade head`; see alembic/README for a database made "
+            "before the migrations."
+        )
+    if is_sqlite:
+        connection.exec_driver_sql(f"PRAGMA user_version = {fingerprint:d}")
+    return created
+
+
+# Read-through caches for product records by id and for catalog listing
+# pages. Every product write in this module invalidates them.
+product_cache = RecordCache(settings["product_cache_size"], settings["product_cache_ttl"])
+product_page_cache = RecordCache(
+    min(settings["product_cache_size"], 256), settings["product_cache_ttl"]
+)
+
+PRODUCT_COLUMNS = (Product.id, Product.name, Product.brand, Product.price, Product.quantity)
+
+
+# Function to drop cached products after a write: the given ids, or all
+# of them when none are given. Listing pages are always dropped.
+def invalidate_products(*product_ids):
+    product_page_cache.clear()
+    if not product_ids:
+        product_cache.clear()
+    for product_id in product_ids:
+        product_cache.invalidate(product_id)
+
+
+# Function to look up one product row by id through the cache
+def get_product(session, product_id):
+    return product_cache.get(
+        product_id,
+        lambda key: session.execute(select(*PRODUCT_COLUMNS).where(Product.id == key)).first(),
     )
-    return products
 
 
-def get_least_sold_products(session):
-    # Query the database to get the products sorted by the total quantity sold in ascending order
-    # Return the sorted list of products
-    products = (
-        session.query(Product)
-        .join(orders)
-        .group_by(Product.id)
-        .order_by(Product.quantity)
-        .all()
+# Function to look up many products at once; the ones not cached yet are
+# fetched with a single IN query. Returns {id: row} for the ids that exist.
+def get_products(session, product_ids):
+    def load_many(missing):
+        query = select(*PRODUCT_COLUMNS).where(Product.id.in_(missing))
+        return {row.id: row for row in session.execute(query)}
+
+    return product_cache.get_many(list(product_ids), load_many)
+
+
+# Turn a result row or a mapped object into a plain dict; dicts, such as
+# the orders returned by purchase_cart, pass through unchanged
+def as_record(row):
+    if isinstance(row, dict):
+        return row
+    if hasattr(row, "_asdict"):
+        return row._asdict()
+    return {column.key: getattr(row, column.key) for column in row.__table__.columns}
+
+
+# Dialect modules with an INSERT ... ON CONFLICT construct, imported only
+# when used so that loading this module does not pull in the Postgres dialect
+UPSERT_DIALECTS = {
+    "sqlite": "sqlalchemy.dialects.sqlite",
+    "postgresql": "sqlalchemy.dialects.postgresql",
+}
+
+
+# Pick the INSERT construct that supports ON CONFLICT for the connection's
+# dialect, or None when the database has no upsert we know how to use
+def upsert_insert(executor, table):
+    bind = executor if hasattr(executor, "dialect") else executor.get_bind()
+    module = UPSERT_DIALECTS.get(bind.dialect.name)
+    return importlib.import_module(module).insert(table) if module is not None else None
+
+
+# Function to bump the data version counters for the given kinds of data
+def bump_data_version(executor, *names):
+    statement = upsert_insert(executor, data_versions)
+    if statement is not None:
+        statement = statement.values(name=bindparam("version_name"), version=1)
+        statement = statement.on_conflict_do_update(
+            index_elements=["name"], set_={"version": data_versions.c.version + 1}
+        )
+        executor.execute(statement, [{"version_name": name} for name in names])
+        return
+
+    for name in names:
+        result = executor.execute(
+            update(data_versions)
+            .where(data_versions.c.name == name)
+            .values(version=data_versions.c.version + 1)
+        )
+        if result.rowcount == 0:
+            executor.execute(insert(data_versions).values(name=name, version=1))
+
+
+# Function to bump the data versions in a short transaction of its own,
+# once the write they describe has committed. Every write bumps the same
+# rows, so bumping inside the write would make concurrent checkouts queue on
+# their row locks (Postgres) for the length of each checkout; here they only
+# wait for this one statement. A report read in between can still be served
+# from the cache until the bump commits. The write has already succeeded,
+# so a failed bump is logged rather than raised.
+def bump_data_version_after_commit(session, *names):
+    try:
+        bump_data_version(session, *names)
+        session.commit()
+    except Exception:
+        session.rollback()
+        data_version_log.exception("Bumping the %s data versions failed", ", ".join(names))
+
+
+# Function to read the current data version as a string such as "orders=4,products=9"
+def current_data_version(executor):
+    rows = executor.execute(select(data_versions).order_by(data_versions.c.name)).all()
+    return ",".join(f"{row.name}={row.version}" for row in rows)
+
+
+# Function to add newly inserted orders to the daily sales rollup.
+# order_rows are dicts with product_id, order_date and quantity; they are
+# summed per product and day first, then upserted with one executemany.
+def record_daily_sales(executor, order_rows):
+    totals, counts = Counter(), Counter()
+    for row in order_rows:
+        totals[(row["product_id"], row["order_date"])] += row["quantity"]
+        counts[(row["product_id"], row["order_date"])] += 1
+    if not totals:
+        return
+    params = [
+        {
+            "sale_product_id": product_id,
+            "sale_day": day,
+            "sale_units": units,
+            "sale_orders": counts[(product_id, day)],
+        }
+        for (product_id, day), units in totals.items()
+    ]
+
+    price = (
+        select(Product.price)
+        .where(Product.id == bindparam("sale_product_id"))
+        .scalar_subquery()
+    )
+    values = {
+        "product_id": bindparam("sale_product_id"),
+        "day": bindparam("sale_day"),
+        "units": bindparam("sale_units"),
+        "revenue": bindparam("sale_units") * func.coalesce(price, 0),
+        "order_count": bindparam("sale_orders"),
+    }
+    statement = upsert_insert(executor, daily_product_sales)
+    if statement is not None:
+        statement = statement.values(**values)
+        statement = statement.on_conflict_do_update(
+            index_elements=["product_id", "day"],
+            set_={
+                "units": daily_product_sales.c.units + statement.excluded.units,
+                "revenue": daily_product_sales.c.revenue + statement.excluded.revenue,
+                "order_count": daily_product_sales.c.order_count + statement.excluded.order_count,
+            },
+        )
+        executor.execute(statement, params)
+        return
+
+    # No upsert available: add to the existing row, insert when there is none
+    increment = (
+        update(daily_product_sales)
+        .where(
+            daily_product_sales.c.product_id == bindparam("sale_product_id"),
+            daily_product_sales.c.day == bindparam("sale_day"),
+        )
+        .values(
+            units=daily_product_sales.c.units + bindparam("sale_units"),
+            revenue=daily_product_sales.c.revenue + values["revenue"],
+            order_count=daily_product_sales.c.order_count + bindparam("sale_orders"),
+        )
     )
-    return products
+    for param in params:
+        if executor.execute(increment, param).rowcount == 0:
+            executor.execute(insert(daily_product_sales).values(**values), param)
 
 
-def get_never_sold_products(session):
-    # Query the database to get the products that have never been sold
-    # Return the list of products
-    products = (
-        session.query(Product)
-        .outerjoin(orders)
+# Function to rebuild the daily sales rollup from the orders table (backfill).
+# Orders do not store the price paid, so revenue keeps the price per unit of
+# the rollup row being replaced; only product days the rollup did not have
+# yet are priced at the current price. Without an upsert the rollup is
+# rebuilt from scratch, which re-prices all of history. Returns the number
+# of product days written.
+def rebuild_daily_sales(executor):
+    bump_data_version(executor, "orders")
+    sales = daily_product_sales
+    columns = ["product_id", "day", "units", "revenue", "order_count"]
+    totals = (
+        select(
+            orders.c.product_id,
+            orders.c.order_date,
+            func.sum(orders.c.quantity),
+            func.sum(orders.c.quantity * func.coalesce(Product.price, 0)),
+            func.count(),
+        )
+        .select_from(orders.outerjoin(Product, Product.id == orders.c.product_id))
+        .where(orders.c.product_id.isnot(None), orders.c.order_date.isnot(None))
+        .group_by(orders.c.product_id, orders.c.order_date)
+    )
+    statement = upsert_insert(executor, sales)
+    if statement is None:
+        executor.execute(delete(sales))
+        return executor.execute(insert(sales).from_select(columns, totals)).rowcount
+
+    # Drop the product days that no longer have any order
+    executor.execute(
+        delete(sales).where(
+            ~select(orders.c.order_id)
+            .where(orders.c.product_id == sales.c.product_id, orders.c.order_date == sales.c.day)
+            .exists()
+        )
+    )
+    statement = statement.from_select(columns, totals)
+    statement = statement.on_conflict_do_update(
+        index_elements=["product_id", "day"],
+        set_={
+            "units": statement.excluded.units,
+            "order_count": statement.excluded.order_count,
+            "revenue": case(
+                (sales.c.units > 0, sales.c.revenue * statement.excluded.units // sales.c.units),
+                else_=statement.excluded.revenue,
+            ),
+        },
+    )
+    return executor.execute(statement).rowcount
+
+
+# Build the aggregate query behind the sales ranking reports.
+# Units sold and revenue are summed per product in SQL and only the plain
+# columns needed for display are selected, so no Product objects are loaded.
+# By default the sums come from the daily rollup, which has one row per
+# product per day instead of one per order; use_rollup=False scans orders.
+# That scan skips undated orders as the rollup does, but orders carry no
+# price, so its revenue is at each product's current price.
+def sales_ranking_query(
+    descending=True, limit=None, start_date=None, end_date=None, use_rollup=True
+):
+    if use_rollup:
+        sales = daily_product_sales
+        day, units, revenue = sales.c.day, sales.c.units, sales.c.revenue
+    else:
+        sales = orders
+        day, units = sales.c.order_date, sales.c.quantity
+        revenue = sales.c.quantity * Product.price
+
+    units_sold = func.sum(units).label("units_sold")
+    revenue = func.sum(revenue).label("revenue")
+    ranking = units_sold.desc() if descending else units_sold.asc()
+    query = (
+        select(
+            Product.id,
+            Product.name,
+            Product.brand,
+            Product.price,
+            units_sold,
+            revenue,
+        )
+        .join(sales, sales.c.product_id == Product.id)
         .group_by(Product.id)
-        .having(~orders.c.product_id.isnot(None))
-        .all()
-    )
-    return products
-
-
-def get_products_purchased_in_date_range(session, start_date, end_date):
-    # Query the database to get the products purchased within the specified date range
-    # Return the list of products
-    products = (
-        session.query(Product)
-        .join(orders)
-        .filter(orders.c.order_date.between(start_date, end_date))
-        .all()
-    )
-    return products
-
-
-@click.command()
-@click.option("--role", prompt="Enter your role (stockmanager/user): ")
-def main(role):
-    if role == "stockmanager":
-        print("Menu:")
-        print("1. Add a product")
-        print("2. View available products")
-        print("3. Update a product")
-        print("4. Delete a product")
-        print("5. Generate reports")
-        print("6. Exit")
-
-        choice = input("Enter your choice: ")
-
-        if choice == "1":
-            name = input("Enter product name: ")
-            brand = input("Enter product brand: ")
-            price = int(input("Enter product price: "))
-            quantity = int(input("Enter product quantity: "))
-
-            product = Product(name=name, brand=brand, price=price, quantity=quantity)
-            session.add(product)
-            session.commit()
-            print("Product added successfully!")
-
-        elif choice == "2":
-            products = session.query(Product).all()
-            print("Available products:")
-            for product in products:
-                print(
-                    f"ID: {product.id}, Name: {product.name}, Brand: {product.brand}, Price: {product.price}, Quantity: {product.quantity}"
-                )
-
-        elif choice == "3":
-            # Code for updating a product
-            product_id = int(input("Enter the ID of the product to update: "))
-            product = session.query(Product).get(product_id)
-            if product is None:
-                print("Invalid product ID!")
-            else:
-                print("Menu:")
-                print("1. Add quantity")
-                print("2. Remove product")
-
-                update_choice = input("Enter your choice: ")
-
-                if update_choice == "1":
-                    quantity = int(input("Enter the quantity to add: "))
-                    product.quantity += quantity
-                    session.commit()
-                    print("Quantity added successfully!")
-                elif update_choice == "2":
-                    session.delete(product)
-                    session.commit()
-                    print("Product removed successfully!")
-                else:
-                    print("Invalid choice!")
-
-
-        elif choice == "4":
-            # Code for deleting a product
-            product_id = int(input("Enter the ID of the product to delete: "))
-            delete_product = delete(Product).where(Product.id == product_id)
-            session.execute(delete_product)
-            session.commit()
-            print("Product deleted successfully!")
-
-        elif choice == "5":
-            print("Report Menu:")
-            print("1. Most sold products")
-            print("2. Least sold products")
-            print("3. Never sold products")
-            print("4. Products purchased in a date range")
-
-            report_choice = input("Enter your choice: ")
-
-            if report_choice == "1":
-                most_sold_products = get_most_sold_products(session)
-                print("Most sold products:")
-                for product in most_sold_products:
-                    print(
-                        f"ID: {product.id}, Name: {product.name}, Brand: {product.brand}, Price: {product.price}, Quantity: {product.quantity}"
-                    )
-
-            elif report_choice == "2":
-                least_sold_products = get_least_sold_products(session)
-                print("Least sold products:")
-                for product in least_sold_products:
-                    print(
-                        f"ID: {product.id}, Name: {product.name}, Brand: {product.brand}, Price: {product.price}, Quantity: {product.quantity}"
-                    )
-
-            elif report_choice == "3":
-                never_sold_products = get_never_sold_products(session)
-                print("Never sold products:")
-                for product in never_sold_products:
-                    print(
-                        f"ID: {product.id}, Name: {product.name}, Brand: {product.brand}, Price: {product.price}, Quantity: {product.quantity}"
-                    )
-
-            elif report_choice == "4":
-                start_date = input("Enter the start date (YYYY-MM-DD): ")
-                end_date = input("Enter the end date (YYYY-MM-DD): ")
-                products_purchased = get_products_purchased_in_date_range(
-                    session, start_date, end_date
-                )
-                print("Products purchased in the specified date range:")
-                for product in products_purchased:
-                    print(
-                        f"ID: {product.id}, Name: {product.name}, Brand: {product.brand}, Price: {product.price}, Quantity: {product.quantity}"
-                    )
-
-            else:
-                print("Invalid choice!")
-
-        elif choice == "6":
+        .order_by(ranking, Product.id)
+    )
+    if not use_rollup:
+        query = query.where(day.isnot(None))
+    if start_date is not None:
+        query = query.where(day >= start_date)
+    if end_date is not None:
+        query = query.where(day <= end_date)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def get_most_sold_products(session, limit=None, start_date=None, end_date=None):
+    # Rank the products by the total quantity sold in descending order
+    # Return (id, name, brand, price, units_sold, revenue) rows
+    query = sales_ranking_query(True, limit, start_date, end_date)
+    return session.execute(query).all()
+
+
+def get_least_sold_products(session, limit=None, start_date=None, end_date=None):
+    # Rank the products by the total quantity sold in ascending order
+    # Return (id, name, brand, price, units_sold, revenue) rows
+    query = sales_ranking_query(False, limit, start_date, end_date)
+    return session.execute(query).all()
+
+
+# Stock and threshold of a set of products, built once as it runs on every purchase
+_STOCK_LEVELS = select(Product.id, Product.quantity, Product.reorder_threshold).where(
+    Product.id.in_(bindparam("stock_product_ids", expanding=True))
+)
+
+
+# A product is low on stock once its quantity is at or below its threshold
+def is_low_stock(quantity, reorder_threshold):
+    return reorder_threshold is not None and quantity is not None and quantity <= reorder_threshold
+
+
+# Function to record the reorder threshold crossings caused by a write.
+# added maps each product the write touched to the units it added (negative
+# for units taken) and old_thresholds holds the thresholds the write changed,
+# so the state before the write follows from the current row. Only the
+# touched products are read, by primary key, so the cost is that of the
+# write and not of the catalog. Call it inside the write's transaction.
+def record_stock_alerts(executor, added, old_thresholds=None):
+    old_thresholds = old_thresholds or {}
+    current = executor.execute(_STOCK_LEVELS, {"stock_product_ids": list(added)}).all()
+
+    created_at = datetime.datetime.now()
+    alerts = []
+    for product_id, quantity, reorder_threshold in current:
+        if reorder_threshold is None and product_id not in old_thresholds:
+            continue
+        was_low = is_low_stock(
+            quantity - added[product_id], old_thresholds.get(product_id, reorder_threshold)
+        )
+        low = is_low_stock(quantity, reorder_threshold)
+        if low == was_low:
+            continue
+        alerts.append(
+            {
+                "product_id": product_id,
+                "kind": "low" if low else "restocked",
+                "quantity": quantity,
+                # A threshold cleared while low still closes the alert
+                "reorder_threshold": (
+                    reorder_threshold if low else old_thresholds.get(product_id, reorder_threshold)
+                ),
+                "created_at": created_at,
+            }
+        )
+    if alerts:
+        executor.execute(stock_alerts.insert(), alerts)
+
+
+# Function to add a product and return its new id
+def add_product(session, name, brand, price, quantity, reorder_threshold=None):
+    product = Product(
+        name=name, brand=brand, price=price, quantity=quantity, reorder_threshold=reorder_threshold
+    )
+    session.add(product)
+    if is_low_stock(quantity, reorder_threshold):
+        session.flush()
+        record_stock_alerts(session, {product.id: 0}, {product.id: None})
+    session.commit()
+    invalidate_products(product.id)
+    bump_data_version_after_commit(session, "products")
+    return product.id
+
+
+# Function to change a product's details and/or add stock in one UPDATE.
+# Returns False when no product has the given id.
+def update_product(session, product_id, add_quantity=0, **changes):
+    values = {field: value for field, value in changes.items() if value is not None}
+    if add_quantity:
+        values["quantity"] = Product.quantity + add_quantity
+    if not values:
+        return get_product(session, product_id) is not None
+    old_thresholds = {}
+    if "reorder_threshold" in values:
+        old_thresholds[product_id] = session.execute(
+            select(Product.reorder_threshold).where(Product.id == product_id)
+        ).scalar()
+    result = session.execute(
+        update(Product)
+        .where(Product.id == product_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if add_quantity or old_thresholds:
+        record_stock_alerts(session, {product_id: add_quantity}, old_thresholds)
+    session.commit()
+    invalidate_products(product_id)
+    bump_data_version_after_commit(session, "products")
+    return result.rowcount == 1
+
+
+# Function to delete a product. Returns False when no product has the given id.
+def delete_product(session, product_id):
+    result = session.execute(delete(Product).where(Product.id == product_id))
+    session.commit()
+    invalidate_products(product_id)
+    bump_data_version_after_commit(session, "products")
+    return result.rowcount == 1
+
+
+# Function to fetch one page of products after a given id (keyset pagination).
+# Only the displayed columns are selected and the id index does the seek, so
+# every page costs the same however deep into the catalog it is. Pages are
+# cached, and their rows prefetched into the product cache.
+def list_products(session, page_size=100, after_id=0):
+    def load_page(key):
+        query = (
+            select(*PRODUCT_COLUMNS)
+            .where(Product.id > after_id)
+            .order_by(Product.id)
+            .limit(page_size)
+        )
+        page = session.execute(query).all()
+        for row in page:
+            product_cache.put(row.id, row)
+        return page
+
+    return product_page_cache.get((page_size, after_id), load_page)
+
+
+# Function to stream the catalog page by page without loading it all at once
+def iter_products(session, page_size=100, after_id=0):
+    while True:
+        page = list_products(session, page_size, after_id)
+        yield from page
+        if len(page) < page_size:
             return
+        after_id = page[-1].id
 
-        else:
-            print("Invalid choice!")
 
-    elif role == "user":
-        # Code for user role
-        username = input("Enter your username: ")
-        customer = session.query(Customer).filter_by(username=username).first()
+# Function to search products by name and brand. Every word of the query
+# must match the start of a word in the name or brand ("sam tv" finds
+# "Samsung TV 55"). On SQLite the FTS5 index answers it, best matches first
+# by bm25 with name weighted over brand, and only the page of hits is joined
+# back to products. Other databases fall back to a prefix LIKE on the whole
+# name or brand. Pages are numbered from 1.
+def search_products(session, query, page_size=20, page=1):
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        return []
+    offset = (page - 1) * page_size
 
-        if customer is None:
-            print("Invalid username!")
+    if session.get_bind().dialect.name == "sqlite":
+        match = " ".join(f'"{term}"*' for term in terms)
+        return session.execute(
+            text(
+                """SELECT products.id, products.name, products.brand,
+                    products.price, products.quantity
+                FROM (
+                    SELECT rowid, bm25(products_fts, 10.0, 1.0) AS score FROM products_fts
+                    WHERE products_fts MATCH :match
+                    ORDER BY score, rowid LIMIT :limit OFFSET :offset
+                ) AS hits
+                JOIN products ON products.id = hits.rowid
+                ORDER BY hits.score, hits.rowid"""
+            ),
+            {"match": match, "limit": page_size, "offset": offset},
+        ).all()
 
-    else:
-        print("Invalid role!")
+    conditions = [
+        or_(Product.name.ilike(f"{term}%"), Product.brand.ilike(f"{term}%")) for term in terms
+    ]
+    return session.execute(
+        select(*PRODUCT_COLUMNS)
+        .where(*conditions)
+        .order_by(Product.id)
+        .limit(page_size)
+        .offset(offset)
+    ).all()
 
-    print()
 
+# Function to find dead stock: products with no sales at all, or none on or
+# after `since`. It is a NOT EXISTS anti-join against the rollup's
+# (product_id, day) primary key, so the cost grows with the number of
+# products rather than products x orders. Pages are keyed on product id.
+def get_never_sold_products(session, since=None, page_size=None, after_id=0):
+    sales = select(daily_product_sales.c.product_id).where(
+        daily_product_sales.c.product_id == Product.id
+    )
+    if since is not None:
+        sales = sales.where(daily_product_sales.c.day >= since)
+    query = (
+        select(*PRODUCT_COLUMNS)
+        .where(Product.id > after_id, ~sales.exists())
+        .order_by(Product.id)
+    )
+    if page_size is not None:
+        query = query.limit(page_size)
+    return session.execute(query).all()
 
-if __name__ == "__main__":
-    Base.metadata.create_all(engine)
 
-    Session = sessionmaker(bind=engine)
-    session = Session()
+# Function to list the products at or below their reorder threshold, the
+# emptiest first. The condition matches the partial ix_products_low_stock
+# index, so only the low products are read, already in quantity order.
+def get_low_stock_products(session, limit=None):
+    query = (
+        select(
+            Product.id, Product.name, Product.brand, Product.quantity, Product.reorder_threshold
+        )
+        .where(Product.quantity <= Product.reorder_threshold)
+        .order_by(Product.quantity, Product.id)
+    )
+    if limit is not None:
+        query = query.limit(limit)
+    return session.execute(query).all()
+
+
+# Function to fetch the stock alerts recorded after a given alert id, oldest
+# first (keyset on alert_id), with the product's name and brand
+def get_stock_alerts(session, after_id=0, limit=100):
+    query = (
+        select(
+            stock_alerts.c.alert_id,
+            stock_alerts.c.created_at,
+            stock_alerts.c.kind,
+            stock_alerts.c.product_id,
+            Product.name,
+            Product.brand,
+            stock_alerts.c.quantity,
+            stock_alerts.c.reorder_threshold,
+        )
+        .select_from(stock_alerts.outerjoin(Product, Product.id == stock_alerts.c.product_id))
+        .where(stock_alerts.c.alert_id > after_id)
+        .order_by(stock_alerts.c.alert_id)
+        .limit(limit)
+    )
+    return session.execute(query).all()
+
+
+# Id of the newest stock alert, 0 when there is none
+def last_stock_alert_id(session):
+    return session.execute(select(func.max(stock_alerts.c.alert_id))).scalar() or 0
+
+
+# Function to turn a report date bound into a date. Accepts a date, a
+# "YYYY-MM-DD" string, or None/"" for an open end of the range.
+def parse_report_date(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(value.strip())
+    except ValueError:
+        raise ValueError(f"Invalid date {value!r}, expected YYYY-MM-DD") from None
+
+
+# Periods the date-range report can be grouped by
+REPORT_PERIODS = ("day", "week", "month")
+
+
+# Function to validate the arguments of the date-range report, raising
+# ValueError for a reversed range or an unknown period. Returns the parsed
+# (start_date, end_date).
+def check_report_range(start_date, end_date, group_by):
+    start_date, end_date = parse_report_date(start_date), parse_report_date(end_date)
+    if start_date is not None and end_date is not None and start_date > end_date:
+        raise ValueError("The start date is after the end date")
+    if group_by is not None and group_by not in REPORT_PERIODS:
+        raise ValueError(f"Cannot group by {group_by!r}, use one of {', '.join(REPORT_PERIODS)}")
+    return start_date, end_date
+
+
+# Build the expression for the period a day column falls in: the day
+# itself, the Monday of its week, or the first day of its month
+def period_expression(dialect_name, day, group_by):
+    if group_by == "day":
+        return day
+    if dialect_name == "sqlite":
+        if group_by == "week":
+            return func.date(day, "-6 days", "weekday 1", type_=Date)
+        return func.date(day, "start of month", type_=Date)
+    return func.date_trunc(group_by, day).cast(Date)
+
+
+# Function to report the products sold between two dates, one row per
+# product (and per day, week or month with group_by) with the units sold,
+# revenue, number of orders and first and last sale day. Both ends are
+# inclusive and either may be None for an open range. The sums come from
+# the daily rollup, so the work and the output grow with the number of
+# products rather than the number of orders. Rows are streamed.
+def get_products_purchased_in_date_range(session, start_date=None, end_date=None, group_by=None):
+    start_date, end_date = check_report_range(start_date, end_date, group_by)
+
+    sales = daily_product_sales
+    columns = [
+        Product.id,
+        Product.name,
+        Product.brand,
+        Product.price,
+        func.sum(sales.c.units).label("units_sold"),
+        func.sum(sales.c.revenue).label("revenue"),
+        func.sum(sales.c.order_count).label("order_count"),
+        func.min(sales.c.day).label("first_sale"),
+        func.max(sales.c.day).label("last_sale"),
+    ]
+    group = [Product.id]
+    if group_by is not None:
+        period = period_expression(session.get_bind().dialect.name, sales.c.day, group_by)
+        columns.insert(0, period.label("period"))
+        group.insert(0, period)
+
+    query = (
+        select(*columns)
+        .join(sales, sales.c.product_id == Product.id)
+        .group_by(*group)
+        .order_by(*group)
+    )
+    if start_date is not None:
+        query = query.where(sales.c.day >= start_date)
+    if end_date is not None:
+        query = query.where(sales.c.day <= end_date)
+    return session.execute(query.execution_options(yield_per=1000))
+
+
+# Columns of one purchase history line: the order plus the product it was for
+def _purchase_history_columns():
+    return (
+        orders.c.order_id,
+        orders.c.order_date,
+        orders.c.quantity,
+        Product.id.label("product_id"),
+        Product.name,
+        Product.brand,
+        Product.price,
+    )
+
+
+# Function to fetch one page of a customer's orders, newest first, in a
+# single joined column-only query served by the (customer_id, order_date)
+# index. Pass the (order_date, order_id) of the last row seen as `before`
+# to get the next page; start_date and end_date bound the range.
+def get_purchase_history(
+    session, customer_id, start_date=None, end_date=None, page_size=100, before=None
+):
+    query = (
+        select(*_purchase_history_columns())
+        .join(Product, Product.id == orders.c.product_id)
+        .where(orders.c.customer_id == customer_id)
+        .order_by(orders.c.order_date.desc(), orders.c.order_id.desc())
+    )
+    if start_date is not None:
+        query = query.where(orders.c.order_date >= start_date)
+    if end_date is not None:
+        query = query.where(orders.c.order_date <= end_date)
+    if before is not None:
+        query = query.where(tuple_(orders.c.order_date, orders.c.order_id) < tuple_(*before))
+    if page_size is not None:
+        query = query.limit(page_size)
+    return session.execute(query).all()
+
+
+# Function to stream a customer's whole purchase history page by page
+def iter_purchase_history(session, customer_id, start_date=None, end_date=None, page_size=100):
+    before = None
+    while True:
+        page = get_purchase_history(session, customer_id, start_date, end_date, page_size, before)
+        yield from page
+        if len(page) < page_size:
+            return
+        before = (page[-1].order_date, page[-1].order_id)
+
+
+# Function to summarise a customer's purchases per product: units, order
+# count, amount spent at today's price and first/last purchase date
+def get_purchase_totals(session, customer_id, start_date=None, end_date=None):
+    query = (
+        select(
+            Product.id,
+            Product.name,
+            Product.brand,
+            Product.price,
+            func.sum(orders.c.quantity).label("units"),
+            func.count(orders.c.order_id).label("orders"),
+            func.sum(orders.c.quantity * Product.price).label("spent"),
+            func.min(orders.c.order_date).label("first_purchase"),
+            func.max(orders.c.order_date).label("last_purchase"),
+        )
+        .join(orders, orders.c.product_id == Product.id)
+        .where(orders.c.customer_id == customer_id)
+        .group_by(Product.id)
+        .order_by(func.max(orders.c.order_date).desc(), Product.id)
+    )
+    if start_date is not None:
+        query = query.where(orders.c.order_date >= start_date)
+    if end_date is not None:
+        query = query.where(orders.c.order_date <= end_date)
+    return session.execute(query).all()
+
+
+# Raised when a purchase cannot be completed
+class PurchaseError(Exception):
+    pass
+
+
+# Raised when a product does not have enough stock left for a purchase
+class OutOfStockError(PurchaseError):
+    pass
+
+
+# Function to purchase a product for a customer.
+# The stock check and the decrement are one guarded UPDATE, so two buyers
+# racing for the last units cannot both succeed, and the order row is
+# inserted in the same short transaction. Returns the new order id.
+def purchase(session, customer_id, product_id, qty, order_date=None):
+    if qty <= 0:
+        raise PurchaseError("Quantity must be greater than zero!")
+
+    try:
+        if not existing_customers(session, [customer_id]):
+            raise PurchaseError("Invalid customer ID!")
+        decrement = (
+            update(Product)
+            .where(Product.id == product_id, Product.quantity >= qty)
+            .values(quantity=Product.quantity - qty)
+            .execution_options(synchronize_session=False)
+        )
+        if session.execute(decrement).rowcount != 1:
+            # Nothing was updated: either the product is gone or the stock ran out
+            exists = session.execute(
+                select(Product.id).where(Product.id == product_id)
+            ).first()
+            if exists is None:
+                raise PurchaseError("Invalid product ID!")
+            raise OutOfStockError("Insufficient quantity!")
+
+        order = {
+            "customer_id": customer_id,
+            "product_id": product_id,
+            "order_date": order_date or datetime.date.today(),
+            "quantity": qty,
+        }
+        result = session.execute(orders.insert().values(**order))
+        record_daily_sales(session, [order])
+        record_stock_alerts(session, {product_id: -qty})
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    invalidate_products(product_id)
+    bump_data_version_after_commit(session, "orders", "products")
+
+    return result.inserted_primary_key[0]
+
+
+# Function to sum a cart's (product_id, qty) lines per product. Products are
+# kept in id order so concurrent carts take row locks in the same order.
+def _cart_quantities(lines):
+    wanted = Counter()
+    for product_id, qty in lines:
+        if qty <= 0:
+            raise PurchaseError("Quantity must be greater than zero!")
+        wanted[product_id] += qty
+    if not wanted:
+        raise PurchaseError("The cart is empty!")
+    return dict(sorted(wanted.items()))
+
+
+# Function to find which of the given customer ids exist. Orders are only
+# placed for known customers: SQLite does not enforce the foreign key.
+def existing_customers(session, customer_ids):
+    return set(
+        session.execute(select(Customer.id).where(Customer.id.in_(set(customer_ids)))).scalars()
+    )
+
+
+# Function to take the stock for every product in the cart with one guarded
+# UPDATE run as an executemany. Returns False when any product is missing or
+# short, in which case the caller must roll back the decrements that did apply.
+def _take_stock(session, wanted):
+    table = Product.__table__
+    decrement = (
+        update(table)
+        .where(
+            table.c.id == bindparam("cart_product_id"),
+            table.c.quantity >= bindparam("cart_qty"),
+        )
+        .values(quantity=table.c.quantity - bindparam("cart_qty"))
+    )
+    params = [
+        {"cart_product_id": product_id, "cart_qty": qty} for product_id, qty in wanted.items()
+    ]
+    if session.get_bind().dialect.supports_sane_multi_rowcount:
+        return session.execute(decrement, params).rowcount == len(params)
+    return all(session.execute(decrement, param).rowcount == 1 for param in params)
+
+
+# Function to explain a failed _take_stock once its decrements are rolled back
+def _stock_error(session, wanted):
+    stock = dict(
+        session.execute(select(Product.id, Product.quantity).where(Product.id.in_(wanted))).all()
+    )
+    missing = [product_id for product_id in wanted if product_id not in stock]
+    if missing:
+        return PurchaseError(f"Invalid product ID: {', '.join(map(str, missing))}")
+    short = [product_id for product_id, qty in wanted.items() if stock[product_id] < qty]
+    return OutOfStockError(f"Insufficient quantity for product {', '.join(map(str, short))}")
+
+
+def _cart_order_rows(customer_id, wanted, order_date):
+    order_date = order_date or datetime.date.today()
+    return [
+        {
+            "customer_id": customer_id,
+            "product_id": product_id,
+            "order_date": order_date,
+            "quantity": qty,
+        }
+        for product_id, qty in wanted.items()
+    ]
+
+
+# Function to purchase a whole cart of (product_id, qty) lines for a customer.
+# It is all or nothing: stock for every line is taken together, all order rows
+# (one per product) go in with one executemany and the cart commits once.
+# Returns the order rows that were written.
+def purchase_cart(session, customer_id, lines, order_date=None):
+    wanted = _cart_quantities(lines)
+    try:
+        if not existing_customers(session, [customer_id]):
+            raise PurchaseError("Invalid customer ID!")
+        if not _take_stock(session, wanted):
+            session.rollback()
+            raise _stock_error(session, wanted)
+        rows = _cart_order_rows(customer_id, wanted, order_date)
+        session.execute(orders.insert(), rows)
+        record_daily_sales(session, rows)
+        record_stock_alerts(session, {product_id: -qty for product_id, qty in wanted.items()})
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    invalidate_products(*wanted)
+    bump_data_version_after_commit(session, "orders", "products")
+    return rows
+
+
+# Function to purchase a batch of carts in one transaction. carts holds
+# (customer_id, lines, order_date) tuples. The stock for all the carts is
+# first taken together with one executemany; only when some cart cannot be
+# filled does each cart take its stock inside its own SAVEPOINT, so that
+# cart is undone on its own while the rest go ahead. The order rows of the
+# whole batch are then inserted, rolled up and committed together.
+# Returns one (rows, error) pair per cart.
+def purchase_carts(session, carts):
+    customers = existing_customers(session, [customer_id for customer_id, _, _ in carts])
+    prepared = []
+    for customer_id, lines, order_date in carts:
+        try:
+            if customer_id not in customers:
+                raise PurchaseError(f"Invalid customer ID: {customer_id}")
+            prepared.append((customer_id, _cart_quantities(lines), order_date, None))
+        except PurchaseError as error:
+            prepared.append((customer_id, None, order_date, error))
+    total = Counter()
+    for _, wanted, _, error in prepared:
+        if error is None:
+            total.update(wanted)
+
+    results, batch_rows, taken = [], [], Counter()
+    try:
+        savepoint = session.begin_nested()
+        taken_together = bool(total) and _take_stock(session, dict(sorted(total.items())))
+        if taken_together:
+            savepoint.commit()
+        else:
+            savepoint.rollback()
+
+        for customer_id, wanted, order_date, error in prepared:
+            if error is None and not taken_together:
+                savepoint = session.begin_nested()
+                if _take_stock(session, wanted):
+                    savepoint.commit()
+                else:
+                    savepoint.rollback()
+                    error = _stock_error(session, wanted)
+            if error is not None:
+                results.append(([], error))
+                continue
+            rows = _cart_order_rows(customer_id, wanted, order_date)
+            results.append((rows, None))
+            batch_rows.extend(rows)
+            taken.update(wanted)
 
-    main()
-    print("Exiting the menu.")
\ No newline at end of file
+        if batch_rows:
+            session.execute(orders.insert(), batch_rows)
+            record_daily_sales(session, batch_rows)
+            record_stock_alerts(session, {product_id: -qty for product_id, qty in taken.items()})
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    if taken:
+        invalidate_products(*taken)
+        bump_data_version_after_commit(session, "orders", "products")
+    return results
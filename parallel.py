@@ -0,0 +1,193 @@
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import func, select
+
+from config import build_read_only_engine
+from models import Product, check_report_range, orders, period_expression, settings
+
+# Per product sales totals over the orders matched by a report
+SalesTotals = namedtuple("SalesTotals", "units revenue order_count first_sale last_sale")
+
+# Rows of the parallel reports. They have the columns of the rollup based
+# reports, but orders carry no price, so revenue is at the current price
+# where the rollup has the price at the time of each order.
+RankingRow = namedtuple("RankingRow", "id name brand price units_sold revenue_at_current_price")
+RangeRow = namedtuple(
+    "RangeRow",
+    "id name brand price units_sold revenue_at_current_price order_count first_sale last_sale",
+)
+PeriodRangeRow = namedtuple("PeriodRangeRow", ("period", *RangeRow._fields))
+
+# Engine of a worker process, opened by _start_worker
+_worker_engine = None
+
+
+def _start_worker(worker_settings):
+    global _worker_engine
+    _worker_engine = build_read_only_engine(worker_settings)
+
+
+# Partial aggregate run in a worker: the totals of every product with an id
+# in [first_id, last_id] over the dated orders between the dates, per day,
+# week or month with group_by. Product ranges map onto the (product_id,
+# order_date) index, so a worker reads only its slice of orders; returns
+# plain (period, product_id, *totals) tuples to keep pickling cheap.
+def _partial_totals(first_id, last_id, start_date, end_date, group_by=None):
+    group = [orders.c.product_id]
+    if group_by is not None:
+        group.insert(
+            0, period_expression(_worker_engine.dialect.name, orders.c.order_date, group_by)
+        )
+    query = (
+        select(
+            *group,
+            func.sum(orders.c.quantity),
+            func.sum(orders.c.quantity * func.coalesce(Product.price, 0)),
+            func.count(),
+            func.min(orders.c.order_date),
+            func.max(orders.c.order_date),
+        )
+        .join(Product, Product.id == orders.c.product_id)
+        .where(
+            orders.c.product_id.between(first_id, last_id), orders.c.order_date.isnot(None)
+        )
+        .group_by(*group)
+    )
+    if start_date is not None:
+        query = query.where(orders.c.order_date >= start_date)
+    if end_date is not None:
+        query = query.where(orders.c.order_date <= end_date)
+    with _worker_engine.connect() as connection:
+        rows = connection.execute(query)
+        if group_by is None:
+            return [(None, *row) for row in rows]
+        return [tuple(row) for row in rows]
+
+
+# Split [low, high] into at most `count` contiguous id ranges
+def id_ranges(low, high, count):
+    size = max(1, -(-(high - low + 1) // count))
+    return [(first, min(first + size - 1, high)) for first in range(low, high + 1, size)]
+
+
+# Function to total the sales of every product over the orders between the
+# dates, scanning orders on a pool of processes. The product id space is cut
+# into several ranges per worker so a slow range does not hold up the rest,
+# each worker reads through its own read-only connection, and the partial
+# results are merged here. Returns {(period, product_id): SalesTotals},
+# where period is None unless group_by is "day", "week" or "month".
+#
+# Partitions are product id ranges rather than date slices: no index on
+# orders leads with order_date, so every date slice would scan the table.
+def parallel_sales_totals(
+    session, start_date=None, end_date=None, workers=None, ranges_per_worker=4, group_by=None
+):
+    workers = workers or os.cpu_count() or 1
+    low, high = session.execute(select(func.min(Product.id), func.max(Product.id))).one()
+    if low is None:
+        return {}
+
+    # Workers open the database the session is using
+    url = session.get_bind().url.render_as_string(hide_password=False)
+    worker_settings = dict(settings, database_url=url)
+
+    totals = {}
+    ranges = id_ranges(low, high, workers * ranges_per_worker)
+    pool = ProcessPoolExecutor(workers, initializer=_start_worker, initargs=(worker_settings,))
+    with pool:
+        partials = pool.map(
+            _partial_totals,
+            [first for first, _ in ranges],
+            [last for _, last in ranges],
+            [start_date] * len(ranges),
+            [end_date] * len(ranges),
+            [group_by] * len(ranges),
+        )
+        for partial in partials:
+            for period, product_id, *values in partial:
+                key = (period, product_id)
+                totals[key] = merge_totals(totals.get(key), SalesTotals(*values))
+    return totals
+
+
+# Combine the totals of one product from two partitions
+def merge_totals(first, second):
+    if first is None:
+        return second
+    return SalesTotals(
+        first.units + second.units,
+        (first.revenue or 0) + (second.revenue or 0),
+        first.order_count + second.order_count,
+        min(first.first_sale, second.first_sale),
+        max(first.last_sale, second.last_sale),
+    )
+
+
+# Name, brand and price of the given products, by id
+def _product_details(session, product_ids):
+    return {
+        row.id: row
+        for row in session.execute(
+            select(Product.id, Product.name, Product.brand, Product.price).where(
+                Product.id.in_(product_ids)
+            )
+        )
+    }
+
+
+# Function to rank the products by units sold like sales_ranking_query with
+# use_rollup=False, but with the orders scan spread over worker processes
+def get_parallel_sales_ranking(
+    session, descending=True, limit=None, start_date=None, end_date=None, workers=None
+):
+    totals = {
+        product_id: value
+        for (_, product_id), value in parallel_sales_totals(
+            session, start_date, end_date, workers
+        ).items()
+    }
+    direction = -1 if descending else 1
+    ranked = sorted(
+        totals, key=lambda product_id: (direction * totals[product_id].units, product_id)
+    )
+    if limit is not None:
+        ranked = ranked[:limit]
+
+    details = _product_details(session, ranked)
+    return [
+        RankingRow(
+            product_id,
+            details[product_id].name,
+            details[product_id].brand,
+            details[product_id].price,
+            totals[product_id].units,
+            totals[product_id].revenue,
+        )
+        for product_id in ranked
+        if product_id in details
+    ]
+
+
+# Function to build the date-range report (one row per product, or per
+# period and product with group_by) like get_products_purchased_in_date_range,
+# but from the orders scanned on worker processes instead of the rollup.
+# Rows come in the same (period, product id) order.
+def get_parallel_purchases_in_date_range(
+    session, start_date=None, end_date=None, group_by=None, workers=None
+):
+    start_date, end_date = check_report_range(start_date, end_date, group_by)
+    totals = parallel_sales_totals(session, start_date, end_date, workers, group_by=group_by)
+    details = _product_details(session, {product_id for _, product_id in totals})
+
+    rows = []
+    for period, product_id in sorted(totals):
+        if product_id not in details:
+            continue
+        product = details[product_id]
+        row = RangeRow(
+            product_id, product.name, product.brand, product.price, *totals[period, product_id]
+        )
+        rows.append(row if group_by is None else PeriodRangeRow(period, *row))
+    return rows
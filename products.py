@@ -1,112 +1,732 @@
-from sqlalchemy import create_engine
-from sqlalchemy import ForeignKey, Table, Column, Integer, String, Date
-from sqlalchemy.orm import relationship, sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import delete
+import time
+
+# Taken before anything else is imported, for --timings
+STARTED = time.perf_counter()
+
+import contextlib
 import datetime
+import functools
+import importlib
+import json
+
 import click
 
-# Create an engine for connecting to the SQLite database
-engine = create_engine("sqlite:///many.db")
-
-# Create a base class for declarative SQLAlchemy models
-Base = declarative_base()
-
-# Define the join table "orders"
-orders = Table(
-    "orders",
-    Base.metadata,
-    Column("order_id", Integer, primary_key=True),
-    Column("customer_id", ForeignKey("customers.id")),
-    Column("product_id", ForeignKey("products.id")),
-    Column("order_date", Date),
-    Column("quantity", Integer),
+# Startup timings in seconds, printed by --timings. Nothing that pulls in
+# SQLAlchemy is imported here: models.py is imported by open_database() when
+# the first command that needs the database runs, and the heavier or rarely
+# used modules (bulk import/export, NumPy analytics, the daemon, query
+# instrumentation) by the commands that use them. --help and usage errors
+# never load them.
+TIMINGS = {"imports": time.perf_counter() - STARTED}
+
+# Session factory, made by open_database()
+Session = None
+
+# Write-behind order journal, running while the shell or the daemon is up
+# when the order_journal setting names a file
+order_journal = None
+
+# Labels used for the human readable output, anything else is title-cased
+LABELS = {"id": "ID", "order_id": "Order ID", "product_id": "Product ID", "alert_id": "Alert ID"}
+
+
+# Print records either as "Label: value" lines or as JSON Lines
+def emit(records, title=None):
+    from models import as_record
+
+    output_format = click.get_current_context().find_root().params["output_format"]
+    if output_format == "text" and title:
+        click.echo(title)
+    for record in records:
+        record = as_record(record)
+        if output_format == "json":
+            click.echo(json.dumps(record, default=str))
+        else:
+            click.echo(
+                ", ".join(
+                    f"{LABELS.get(key, key.replace('_', ' ').capitalize())}: {value}"
+                    for key, value in record.items()
+                )
+            )
+
+
+# Command group whose listed subcommands are imported from their module
+# only when invoked. lazy_commands maps a name to the command's import path
+# and the short help shown by --help, which is listed without importing it,
+# e.g. {"import": ("importer.import_file", "Bulk load products or orders.")}
+class LazyGroup(click.Group):
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx):
+        return sorted([*super().list_commands(ctx), *self.lazy_commands])
+
+    def get_command(self, ctx, name):
+        if name not in self.lazy_commands:
+            return super().get_command(ctx, name)
+        module, attribute = self.lazy_commands[name][0].rsplit(".", 1)
+        return getattr(importlib.import_module(module), attribute)
+
+    def format_commands(self, ctx, formatter):
+        names = self.list_commands(ctx)
+        limit = formatter.width - 6 - max(map(len, names))
+        rows = []
+        for name in names:
+            if name in self.lazy_commands:
+                rows.append((name, self.lazy_commands[name][1]))
+                continue
+            command = super().get_command(ctx, name)
+            if command is not None and not command.hidden:
+                rows.append((name, command.get_short_help_str(limit)))
+        with formatter.section("Commands"):
+            formatter.write_dl(rows)
+
+
+# Top level command group, one session is shared by the whole invocation
+# (see pass_session).
+@click.group(
+    cls=LazyGroup,
+    lazy_commands={
+        "export": ("exporter.export_file", "Export orders joined with their products, partitioned by month."),
+        "import": ("importer.import_file", "Bulk load products or orders from a .csv or .jsonl file."),
+    },
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    help="Output style; json prints one JSON object per line.",
 )
+@click.option("--profile", is_flag=True, help="Print a summary of the SQL run by the command when it exits.")
+@click.option(
+    "--slow-query-ms",
+    type=float,
+    envvar="PMS_SLOW_QUERY_MS",
+    help="Log statements slower than this many milliseconds.",
+)
+@click.option(
+    "--slow-query-log",
+    type=click.Path(dir_okay=False),
+    envvar="PMS_SLOW_QUERY_LOG",
+    help="File for the slow query log (threshold defaults to 100 ms).",
+)
+@click.option("--timings", is_flag=True, help="Print import, schema check and command times on exit.")
+@click.pass_context
+def cli(ctx, output_format, profile, slow_query_ms, slow_query_log, timings):
+    if timings:
+        started = time.perf_counter()
+        ctx.call_on_close(lambda: print_timings(time.perf_counter() - started))
+    if slow_query_log or profile or slow_query_ms is not None:
+        from instrumentation import QueryProfiler, log_slow_queries_to
+        from models import engine
+    if slow_query_log:
+        log_slow_queries_to(slow_query_log)
+        if slow_query_ms is None:
+            slow_query_ms = 100
+    if profile or slow_query_ms is not None:
+        profiler = QueryProfiler(slow_query_ms).attach(engine)
+        ctx.call_on_close(profiler.detach)
+        if profile:
+            ctx.call_on_close(lambda: click.echo(profiler.summary(), err=True))
+
+
+# Print the startup timings and the command's own time on stderr
+def print_timings(command_seconds):
+    # The database is opened by the command, count it on its own
+    opening = TIMINGS.get("database_imports", 0) + TIMINGS.get("schema_check", 0)
+    timings = dict(TIMINGS, command=command_seconds - opening)
+    click.echo(
+        ", ".join(
+            f"{name.replace('_', ' ')}: {seconds * 1000:.1f} ms" for name, seconds in timings.items()
+        ),
+        err=True,
+    )
 
-# Define the Product model
-class Product(Base):
-    __tablename__ = "products"
-    id = Column(Integer(), primary_key=True)
-    name = Column(String())
-    brand = Column(String())
-    price = Column(Integer())
-    quantity = Column(Integer())
-    customers = relationship("Customer", secondary=orders, back_populates="products")
-
-# Define the Customer model
-class Customer(Base):
-    __tablename__ = "customers"
-    id = Column(Integer(), primary_key=True)
-    name = Column(String())
-    email = Column(String())
-    username = Column(String())
-    role = Column(String())
-    products = relationship("Product", secondary=orders, back_populates="customers")
-
-
-# Function to get the most sold products from the database
-def get_most_sold_products(session):
-    # Query the database to get the products sorted by the total quantity sold in descending order
-    # Return the sorted list of products
-    products = (
-        session.query(Product)
-        .join(orders)
-        .group_by(Product.id)
-        .order_by(Product.quantity.desc())
-        .all()
+
+# Function to import the models, and with them SQLAlchemy (most of the
+# startup time), create any missing tables unless the database is already
+# stamped with this schema, and make the session factory. Runs once, when
+# the first command that uses the database starts.
+def open_database():
+    global Session
+    if Session is None:
+        started = time.perf_counter()
+        from sqlalchemy.orm import sessionmaker
+
+        from models import SchemaOutOfDateError, engine, ensure_schema
+
+        TIMINGS["database_imports"] = time.perf_counter() - started
+        started = time.perf_counter()
+        try:
+            with engine.begin() as connection:
+                ensure_schema(connection)
+        except SchemaOutOfDateError as error:
+            raise click.ClickException(str(error))
+        TIMINGS["schema_check"] = time.perf_counter() - started
+        Session = sessionmaker(bind=engine)
+    return Session
+
+
+# Pass the invocation's session to a command as its first argument. The
+# shell and the daemon pass their long-lived session in as the context
+# object; otherwise one is opened when the command starts and closed when
+# the invocation ends.
+def pass_session(function):
+    @click.pass_context
+    @functools.wraps(function)
+    def command(ctx, *args, **kwargs):
+        root = ctx.find_root()
+        if root.obj is None:
+            root.obj = open_database()()
+            root.call_on_close(root.obj.close)
+        return function(root.obj, *args, **kwargs)
+
+    return command
+
+
+@cli.group()
+def product():
+    """Add, list, update and delete products."""
+
+
+@product.command("add")
+@click.argument("name")
+@click.argument("brand")
+@click.argument("price", type=int)
+@click.argument("quantity", type=int)
+@click.option("--reorder-threshold", type=click.IntRange(min=0), help="Alert when the stock drops to this level.")
+@pass_session
+def product_add(session, name, brand, price, quantity, reorder_threshold):
+    from models import add_product
+
+    product_id = add_product(session, name, brand, price, quantity, reorder_threshold)
+    emit([{"id": product_id}])
+
+
+@product.command("list")
+@click.option("--page-size", type=click.IntRange(min=1), default=100, help="Products fetched per page.")
+@click.option("--after-id", type=int, default=0, help="List products with an ID greater than this one.")
+@pass_session
+def product_list(session, page_size, after_id):
+    from models import iter_products
+
+    emit(iter_products(session, page_size, after_id), "Available products:")
+
+
+@product.command("get")
+@click.argument("product_id", type=int)
+@pass_session
+def product_get(session, product_id):
+    from models import get_product
+
+    product = get_product(session, product_id)
+    if product is None:
+        raise click.ClickException("Invalid product ID!")
+    emit([product])
+
+
+@product.command("search")
+@click.argument("query", nargs=-1, required=True)
+@click.option("--page", type=click.IntRange(min=1), default=1, show_default=True)
+@click.option("--page-size", type=click.IntRange(min=1), default=20, show_default=True)
+@pass_session
+def product_search(session, query, page, page_size):
+    """Find products whose name or brand words start with every QUERY word."""
+    from models import search_products
+
+    emit(search_products(session, " ".join(query), page_size, page), "Matching products:")
+
+
+@product.command("low-stock")
+@click.option("--limit", type=click.IntRange(min=1), help="Show at most this many products.")
+@pass_session
+def product_low_stock(session, limit):
+    """List the products at or below their reorder threshold, emptiest first."""
+    from models import get_low_stock_products
+
+    emit(get_low_stock_products(session, limit), "Low stock products:")
+
+
+@product.command("watch-stock")
+@click.option("--after-id", type=int, help="Start after this alert ID (default: only new alerts, or all with --once).")
+@click.option("--interval", type=click.FloatRange(min=0.01), default=1.0, show_default=True, help="Seconds between checks for new alerts.")
+@click.option("--once", is_flag=True, help="Print the alerts recorded so far and exit (required in shell and serve).")
+@pass_session
+def product_watch_stock(session, after_id, interval, once):
+    """Print an alert each time a product crosses its reorder threshold.
+
+    Purchases and restocks record the crossings as they happen, so the
+    watcher only reads the alerts added since its last check.
+    """
+    from models import get_stock_alerts, last_stock_alert_id
+
+    if not once and session.info.get("in_shell"):
+        raise click.UsageError(
+            "watch-stock runs until interrupted and would block the shell; use --once, "
+            "or run it as its own process."
+        )
+    if after_id is None:
+        after_id = 0 if once else last_stock_alert_id(session)
+    while True:
+        alerts = get_stock_alerts(session, after_id)
+        # End the read transaction so the next check sees new commits
+        session.rollback()
+        if alerts:
+            emit(alerts)
+            after_id = alerts[-1].alert_id
+        elif once:
+            return
+        else:
+            time.sleep(interval)
+
+
+@product.command("cache-stats")
+def product_cache_stats():
+    """Show the product cache's size, hits and misses."""
+    from models import product_cache
+
+    emit([product_cache.stats()])
+
+
+@product.command("update")
+@click.argument("product_id", type=int)
+@click.option("--add-quantity", type=int, default=0, help="Quantity to add to the stock.")
+@click.option("--name")
+@click.option("--brand")
+@click.option("--price", type=int)
+@click.option("--reorder-threshold", type=click.IntRange(min=0), help="Alert when the stock drops to this level.")
+@pass_session
+def product_update(session, product_id, add_quantity, name, brand, price, reorder_threshold):
+    from models import update_product
+
+    if not update_product(
+        session,
+        product_id,
+        add_quantity=add_quantity,
+        name=name,
+        brand=brand,
+        price=price,
+        reorder_threshold=reorder_threshold,
+    ):
+        raise click.ClickException("Invalid product ID!")
+    emit([{"id": product_id, "updated": True}])
+
+
+@product.command("delete")
+@click.argument("product_id", type=int)
+@pass_session
+def product_delete(session, product_id):
+    from models import delete_product
+
+    if not delete_product(session, product_id):
+        raise click.ClickException("Invalid product ID!")
+    emit([{"id": product_id, "deleted": True}])
+
+
+@cli.group()
+@click.option("--no-cache", is_flag=True, help="Recompute the report instead of using a cached result.")
+@click.pass_context
+def report(ctx, no_cache):
+    """Sales reports."""
+    ctx.meta["use_report_cache"] = not no_cache
+
+
+# Run a report through the result cache unless --no-cache was given
+def run_report(session, name, function, **params):
+    from reports import report_cache
+
+    if not click.get_current_context().meta.get("use_report_cache", True):
+        return function(session, **params)
+    return report_cache.get(session, name, function, **params)
+
+
+# Optional whole-day bounds shared by the ranking reports
+def date_range_options(command):
+    command = click.option("--end-date", type=click.DateTime(formats=["%Y-%m-%d"]))(command)
+    command = click.option("--start-date", type=click.DateTime(formats=["%Y-%m-%d"]))(command)
+    return command
+
+
+# Option to scan orders on a pool of worker processes (see parallel.py)
+def workers_option(command):
+    return click.option(
+        "--workers",
+        type=click.IntRange(min=1),
+        help="Total the orders on this many processes instead of reading the rollup. "
+        "Revenue is then at the current price, not the price at order time.",
+    )(command)
+
+
+def run_parallel_ranking(session, descending, limit, start_date, end_date, workers):
+    from parallel import get_parallel_sales_ranking
+
+    return run_report(
+        session,
+        "sales_ranking_parallel",
+        get_parallel_sales_ranking,
+        descending=descending,
+        limit=limit,
+        start_date=as_date(start_date),
+        end_date=as_date(end_date),
+        workers=workers,
     )
-    return products
-
-# Function to get the least sold products from the database
-def get_least_sold_products(session):
-    # Query the database to get the products sorted by the total quantity sold in ascending order
-    # Return the sorted list of products
-    products = (
-        session.query(Product)
-        .join(orders)
-        .group_by(Product.id)
-        .order_by(Product.quantity)
-        .all()
+
+
+# Convert an optional click DateTime value to a date
+def as_date(value):
+    return value.date() if value is not None else None
+
+
+@report.command("most-sold")
+@click.option("--limit", type=int, default=10, show_default=True)
+@date_range_options
+@workers_option
+@pass_session
+def report_most_sold(session, limit, start_date, end_date, workers):
+    from models import get_most_sold_products
+
+    if workers:
+        rows = run_parallel_ranking(session, True, limit, start_date, end_date, workers)
+    else:
+        rows = run_report(
+            session,
+            "most_sold",
+            get_most_sold_products,
+            limit=limit,
+            start_date=as_date(start_date),
+            end_date=as_date(end_date),
+        )
+    emit(rows, "Most sold products:")
+
+
+@report.command("least-sold")
+@click.option("--limit", type=int, default=10, show_default=True)
+@date_range_options
+@workers_option
+@pass_session
+def report_least_sold(session, limit, start_date, end_date, workers):
+    from models import get_least_sold_products
+
+    if workers:
+        rows = run_parallel_ranking(session, False, limit, start_date, end_date, workers)
+    else:
+        rows = run_report(
+            session,
+            "least_sold",
+            get_least_sold_products,
+            limit=limit,
+            start_date=as_date(start_date),
+            end_date=as_date(end_date),
+        )
+    emit(rows, "Least sold products:")
+
+
+@report.command("never-sold")
+@click.option("--since", type=click.DateTime(formats=["%Y-%m-%d"]), help="Only count sales on or after this date.")
+@click.option("--page-size", type=click.IntRange(min=1), help="Return at most this many products.")
+@click.option("--after-id", type=int, default=0, help="List products with an ID greater than this one.")
+@pass_session
+def report_never_sold(session, since, page_size, after_id):
+    from models import get_never_sold_products
+
+    rows = run_report(
+        session,
+        "never_sold",
+        get_never_sold_products,
+        since=as_date(since),
+        page_size=page_size,
+        after_id=after_id,
     )
-    return products
-
-# Function to get the products that have never been sold
-def get_never_sold_products(session):
-    # Query the database to get the products that have never been sold
-    # Return the list of products
-    products = (
-        session.query(Product)
-        .outerjoin(orders)
-        .group_by(Product.id)
-        .having(~orders.c.product_id.isnot(None))
-        .all()
+    emit(rows, "Never sold products:")
+
+
+@report.command("range")
+@date_range_options
+@click.option("--group-by", type=click.Choice(["day", "week", "month"]), help="One row per product per day, week or month.")
+@workers_option
+@pass_session
+def report_range(session, start_date, end_date, group_by, workers):
+    """Units, revenue, orders and first/last sale per product in a date range."""
+    from models import get_products_purchased_in_date_range
+
+    start_date, end_date = as_date(start_date), as_date(end_date)
+    try:
+        if workers:
+            from parallel import get_parallel_purchases_in_date_range
+
+            rows = run_report(
+                session,
+                "date_range_parallel",
+                get_parallel_purchases_in_date_range,
+                start_date=start_date,
+                end_date=end_date,
+                group_by=group_by,
+                workers=workers,
+            )
+        else:
+            # Not cached: the cache keeps the whole result as one list and
+            # JSON blob, while the query streams its rows straight to emit
+            rows = get_products_purchased_in_date_range(session, start_date, end_date, group_by)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    emit(rows, "Products purchased in the specified date range:")
+
+
+@report.command("reorder-soon")
+@click.option("--window", "window_days", type=click.IntRange(min=1), default=28, show_default=True, help="Days of sales to average over.")
+@click.option("--recent", "recent_days", type=click.IntRange(min=1), default=7, show_default=True, help="Short window used to catch rising sales.")
+@click.option("--lead-time", "lead_time_days", type=click.IntRange(min=0), default=7, show_default=True, help="Days a reorder takes to arrive.")
+@click.option("--safety-days", type=click.IntRange(min=0), default=3, show_default=True, help="Extra days of stock to keep on hand.")
+@click.option("--as-of", type=click.DateTime(formats=["%Y-%m-%d"]), help="Last day of the sales window (default: today).")
+@click.option("--limit", type=int, help="Show at most this many products.")
+@pass_session
+def report_reorder_soon(session, window_days, recent_days, lead_time_days, safety_days, as_of, limit):
+    """Products expected to run out within the lead time plus safety days."""
+    from analytics import get_reorder_soon_products
+
+    rows = run_report(
+        session,
+        "reorder_soon",
+        get_reorder_soon_products,
+        window_days=window_days,
+        recent_days=recent_days,
+        lead_time_days=lead_time_days,
+        safety_days=safety_days,
+        as_of=as_date(as_of) or datetime.date.today(),
+        limit=limit,
     )
-    return products
-
-
-# Function to get the products purchased within a specified date range
-def get_products_purchased_in_date_range(session, start_date, end_date):
-    # Query the database to get the products purchased within the specified date range
-    # Return the list of products
-    products = (
-        session.query(Product)
-        .join(orders)
-        .filter(orders.c.order_date.between(start_date, end_date))
-        .all()
+    emit(rows, "Products to reorder soon:")
+
+
+@report.command("rebuild-rollup")
+@pass_session
+def report_rebuild_rollup(session):
+    """Recompute the daily sales rollup from the orders table.
+
+    Revenue keeps the price recorded in the rollup; product days it did not
+    have yet are priced at the current price.
+    """
+    from models import rebuild_daily_sales
+
+    days = rebuild_daily_sales(session)
+    session.commit()
+    emit([{"rollup_rows": days}])
+
+
+@report.command("cache-stats")
+def report_cache_stats():
+    """Show how often reports were served from the cache."""
+    from reports import report_cache
+
+    emit([report_cache.stats()])
+
+
+@cli.group()
+def order():
+    """Place orders."""
+
+
+# Read carts from a JSON Lines file, one {"customer_id": 1, "lines":
+# [[product_id, qty], ...], "order_date": "YYYY-MM-DD"} object per line
+def read_carts(handle):
+    for line_no, line in enumerate(handle, start=1):
+        if not line.strip():
+            continue
+        try:
+            cart = json.loads(line)
+            order_date = cart.get("order_date")
+            yield (
+                int(cart["customer_id"]),
+                [(int(product_id), int(qty)) for product_id, qty in cart["lines"]],
+                datetime.date.fromisoformat(order_date) if order_date else None,
+            )
+        except (KeyError, TypeError, ValueError) as error:
+            raise click.ClickException(f"Line {line_no}: invalid cart ({error})")
+
+
+@order.command("create")
+@click.argument("customer_id", type=int, required=False)
+@click.argument("items", nargs=-1, type=int)
+@click.option(
+    "--carts",
+    type=click.File(),
+    help="JSON Lines file of carts to place instead of a single order.",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=100,
+    show_default=True,
+    help="Carts committed per transaction when reading --carts.",
+)
+@pass_session
+def order_create(session, customer_id, items, carts, batch_size):
+    """Place an order: CUSTOMER_ID PRODUCT_ID QUANTITY [PRODUCT_ID QUANTITY ...].
+
+    Several PRODUCT_ID QUANTITY pairs form one cart that is placed all or
+    nothing. With --carts, every cart in the file is placed, BATCH_SIZE carts
+    per transaction, and the ones that cannot be filled are reported.
+    """
+    from models import PurchaseError, purchase, purchase_cart
+
+    if carts is not None:
+        if customer_id is not None:
+            raise click.UsageError("Pass either --carts or CUSTOMER_ID and items, not both.")
+        place_carts(session, read_carts(carts), batch_size)
+        return
+    if customer_id is None or not items or len(items) % 2:
+        raise click.UsageError("Expected CUSTOMER_ID followed by PRODUCT_ID QUANTITY pairs.")
+
+    lines = list(zip(items[::2], items[1::2]))
+    try:
+        if order_journal is not None:
+            seq = order_journal.purchase(customer_id, lines)
+            emit([{"journal_seq": seq, "customer_id": customer_id, "lines": len(lines)}])
+            return
+        if len(lines) == 1:
+            product_id, quantity = lines[0]
+            order_id = purchase(session, customer_id, product_id, quantity)
+            emit([{"order_id": order_id, "product_id": product_id, "quantity": quantity}])
+            return
+        rows = purchase_cart(session, customer_id, lines)
+    except PurchaseError as error:
+        raise click.ClickException(str(error))
+    emit(
+        [{"product_id": row["product_id"], "quantity": row["quantity"]} for row in rows],
+        f"Cart placed for customer {customer_id}:",
     )
-    return products
 
-# Command-line interface function
-@click.command()
-@click.option("--role", prompt="Enter your role (store manager/user): ")
-def main(role):
-# Create a session to interact with the database
-    Session = sessionmaker(bind=engine)
-    session = Session()
 
+# Place carts one batch (and one commit) at a time, reporting the carts
+# that could not be filled on stderr
+def place_carts(session, carts, batch_size):
+    from importer import batched
+    from models import purchase_carts
+
+    placed = failed = cart_no = 0
+    for batch in batched(carts, batch_size):
+        for (customer_id, _, _), (_, error) in zip(batch, purchase_carts(session, batch)):
+            cart_no += 1
+            if error is not None:
+                failed += 1
+                click.echo(f"Cart {cart_no} (customer {customer_id}) not placed: {error}", err=True)
+            else:
+                placed += 1
+    click.echo(f"Placed {placed} carts, {failed} could not be filled.")
+
+
+# Run the configured order journal (see journal.py) for the duration of a
+# long running command, flushing it when the command ends
+@contextlib.contextmanager
+def journal_running():
+    global order_journal
+    from journal import journal_from_settings
+    from models import engine, settings
+
+    order_journal = journal_from_settings(settings, engine)
+    if order_journal is None:
+        yield
+        return
+    try:
+        order_journal.start()
+    except RuntimeError as error:
+        order_journal = None
+        raise click.ClickException(str(error))
+    try:
+        yield
+    finally:
+        order_journal.stop()
+        order_journal = None
+
+
+# Load the mappers and open a pooled connection up front so the first
+# command run by the shell or the daemon does not pay for it
+def warm_up():
+    from sqlalchemy.orm import configure_mappers
+
+    from models import engine
+
+    configure_mappers()
+    with engine.connect():
+        pass
+
+
+@cli.command()
+@pass_session
+def shell(session):
+    """Run commands read from stdin in this process, one per line."""
+    from daemon import serve_stdin
+
+    warm_up()
+    with journal_running():
+        serve_stdin(cli, session)
+
+
+@cli.command()
+@click.option("--socket", "socket_path", default="pms.sock", show_default=True)
+def serve(socket_path):
+    """Serve commands on a local Unix socket (see daemon.py for a client)."""
+    from daemon import serve_socket
+
+    warm_up()
+    with journal_running():
+        serve_socket(cli, open_database(), socket_path)
+
+
+@order.command("history")
+@click.argument("customer_id", type=int)
+@date_range_options
+@click.option("--by-product", is_flag=True, help="One line per product with totals instead of one per order.")
+@click.option("--page-size", type=click.IntRange(min=1), help="Return at most this many orders.")
+@click.option("--before-date", type=click.DateTime(formats=["%Y-%m-%d"]), help="Continue after the order with this date...")
+@click.option("--before-order-id", type=int, help="...and this order id (the last line of the previous page).")
+@pass_session
+def order_history(session, customer_id, start_date, end_date, by_product, page_size, before_date, before_order_id):
+    """Show a customer's purchase history."""
+    from models import get_purchase_history, get_purchase_totals, iter_purchase_history
+
+    start_date, end_date = as_date(start_date), as_date(end_date)
+    if by_product:
+        emit(get_purchase_totals(session, customer_id, start_date, end_date), "Products purchased:")
+    elif page_size is None:
+        emit(iter_purchase_history(session, customer_id, start_date, end_date), "Orders:")
+    else:
+        if (before_date is None) != (before_order_id is None):
+            raise click.UsageError("--before-date and --before-order-id go together.")
+        before = (before_date.date(), before_order_id) if before_date is not None else None
+        emit(get_purchase_history(session, customer_id, start_date, end_date, page_size, before), "Orders:")
+
+
+# Interactive menu for clerks, kept alongside the scriptable commands
+@cli.command()
+@click.option("--role", prompt="Enter your role (stockmanager/user): ")
+@click.option("--limit", type=int, default=10, help="Number of products shown in the sales ranking reports.")
+@click.option("--page-size", type=click.IntRange(min=1), default=100, help="Products fetched per page when listing.")
+@click.option("--after-id", type=int, default=0, help="List products with an ID greater than this one.")
+@pass_session
+def menu(session, role, limit, page_size, after_id):
+    """Interactive stock manager / user menu."""
+    from models import (
+        Customer,
+        PurchaseError,
+        add_product,
+        delete_product,
+        get_least_sold_products,
+        get_most_sold_products,
+        get_never_sold_products,
+        get_product,
+        get_products_purchased_in_date_range,
+        iter_products,
+        iter_purchase_history,
+        parse_report_date,
+        purchase,
+        update_product,
+    )
 
     if role == "stockmanager":
-                # Stock manager menu
+        # Stock manager menu
         print("Menu:")
         print("1. Add a product")
         print("2. View available products")
@@ -124,16 +744,13 @@ def main(role):
             price = int(input("Enter product price: "))
             quantity = int(input("Enter product quantity: "))
 
-            product = Product(name=name, brand=brand, price=price, quantity=quantity)
-            session.add(product)
-            session.commit()
+            add_product(session, name, brand, price, quantity)
             print("Product added successfully!")
 
         elif choice == "2":
-            # View available products
-            products = session.query(Product).all()
+            # View available products, streamed one page at a time
             print("Available products:")
-            for product in products:
+            for product in iter_products(session, page_size, after_id):
                 print(
                     f"ID: {product.id}, Name: {product.name}, Brand: {product.brand}, Price: {product.price}, Quantity: {product.quantity}"
                 )
@@ -141,7 +758,7 @@ def main(role):
         elif choice == "3":
             #updating a product
             product_id = int(input("Enter the ID of the product to update: "))
-            product = session.query(Product).get(product_id)
+            product = get_product(session, product_id)
             if product is None:
                 print("Invalid product ID!")
             else:
@@ -153,12 +770,10 @@ def main(role):
 
                 if update_choice == "1":
                     quantity = int(input("Enter the quantity to add: "))
-                    product.quantity += quantity
-                    session.commit()
+                    update_product(session, product_id, add_quantity=quantity)
                     print("Quantity added successfully!")
                 elif update_choice == "2":
-                    session.delete(product)
-                    session.commit()
+                    delete_product(session, product_id)
                     print("Product removed successfully!")
                 else:
                     print("Invalid choice!")
@@ -166,9 +781,7 @@ def main(role):
         elif choice == "4":
             #deleting a product
             product_id = int(input("Enter the ID of the product to delete: "))
-            delete_product = delete(Product).where(Product.id == product_id)
-            session.execute(delete_product)
-            session.commit()
+            delete_product(session, product_id)
             print("Product deleted successfully!")
 
         elif choice == "5":
@@ -183,20 +796,20 @@ def main(role):
 
             if report_choice == "1":
             # Most sold products report
-                most_sold_products = get_most_sold_products(session)
+                most_sold_products = get_most_sold_products(session, limit)
                 print("Most sold products:")
                 for product in most_sold_products:
                     print(
-                        f"ID: {product.id}, Name: {product.name}, Brand: {product.brand}, Price: {product.price}, Quantity: {product.quantity}"
+                        f"ID: {product.id}, Name: {product.name}, Brand: {product.brand}, Price: {product.price}, Units sold: {product.units_sold}, Revenue: {product.revenue}"
                     )
 
             elif report_choice == "2":
             # Least sold products report
-                least_sold_products = get_least_sold_products(session)
+                least_sold_products = get_least_sold_products(session, limit)
                 print("Least sold products:")
                 for product in least_sold_products:
                     print(
-                        f"ID: {product.id}, Name: {product.name}, Brand: {product.brand}, Price: {product.price}, Quantity: {product.quantity}"
+                        f"ID: {product.id}, Name: {product.name}, Brand: {product.brand}, Price: {product.price}, Units sold: {product.units_sold}, Revenue: {product.revenue}"
                     )
 
             elif report_choice == "3":
@@ -210,15 +823,23 @@ def main(role):
 
             elif report_choice == "4":
             # Products purchased in a date range report
-                start_date = input("Enter the start date (YYYY-MM-DD): ")
-                end_date = input("Enter the end date (YYYY-MM-DD): ")
-                products_purchased = get_products_purchased_in_date_range(
-                    session, start_date, end_date
-                )
+                try:
+                    start_date = parse_report_date(
+                        input("Enter the start date (YYYY-MM-DD, blank for no limit): ") or None
+                    )
+                    end_date = parse_report_date(
+                        input("Enter the end date (YYYY-MM-DD, blank for no limit): ") or None
+                    )
+                    products_purchased = get_products_purchased_in_date_range(
+                        session, start_date, end_date
+                    )
+                except ValueError as error:
+                    print(error)
+                    return
                 print("Products purchased in the specified date range:")
                 for product in products_purchased:
                     print(
-                        f"ID: {product.id}, Name: {product.name}, Brand: {product.brand}, Price: {product.price}, Quantity: {product.quantity}"
+                        f"ID: {product.id}, Name: {product.name}, Brand: {product.brand}, Price: {product.price}, Units sold: {product.units_sold}, Revenue: {product.revenue}, Orders: {product.order_count}, First sale: {product.first_sale}, Last sale: {product.last_sale}"
                     )
 
             else:
@@ -248,38 +869,22 @@ def main(role):
         user_choice = input("Enter choice: ")
 
         if user_choice == "1":
-            # View purchased products
+            # View purchased products, one line per order with its quantity and date
             print("Products purchased:")
-            for product in customer.products:
+            for line in iter_purchase_history(session, customer.id, page_size=page_size):
                 print(
-                    f"ID: {product.id}, Name: {product.name}, Brand: {product.brand}, Price: {product.price}, Quantity: {product.quantity}"
+                    f"Order: {line.order_id}, Date: {line.order_date}, ID: {line.product_id}, Name: {line.name}, Brand: {line.brand}, Price: {line.price}, Quantity: {line.quantity}"
                 )
 
         elif user_choice == "2":
             # Purchase a product
             product_id = int(input("Enter the ID of the product to purchase: "))
-            product = session.query(Product).get(product_id)
-
-            if product is None:
-                print("Invalid product ID!")
-            elif product.quantity <= 0:
-                print("Product is out of stock!")
-            else:
-                quantity = int(input("Enter the quantity to purchase: "))
-                if quantity <= product.quantity:
-                    order_date = datetime.date.today()
-                    order = orders.insert().values(
-                        customer_id=customer.id,
-                        product_id=product.id,
-                        order_date=order_date,
-                        quantity=quantity,
-                    )
-                    session.execute(order)
-                    product.quantity -= quantity
-                    session.commit()
-                    print("Product purchased successfully!")
-                else:
-                    print("Insufficient quantity!")
+            quantity = int(input("Enter the quantity to purchase: "))
+            try:
+                purchase(session, customer.id, product_id, quantity)
+                print("Product purchased successfully!")
+            except PurchaseError as error:
+                print(error)
 
         elif user_choice == "3":
             # Exit the program
@@ -291,259 +896,8 @@ def main(role):
     else:
         print("Invalid role!")
 
-    session.close()
     print("Exiting the menu.")
 
 
 if __name__ == "__main__":
-    # Create the database tables based on the defined models
-    Base.metadata.create_all(engine)
-
-    # main(None)
-# Create a session and start the main CLI program
-    Session = sessionmaker(bind=engine)
-    session = Session()
-
-    main()
-    print("Exiting menu.")
-
-
-
-#     main()
-#     print("Exiting the menu.")
-from sqlalchemy import create_engine
-from sqlalchemy import ForeignKey, Table, Column, Integer, String, Date
-from sqlalchemy.orm import relationship, sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import delete
-import datetime
-import click
-
-engine = create_engine("sqlite:///many.db")
-Base = declarative_base()
-
-# Define the join table "orders"
-orders = Table(
-    "orders",
-    Base.metadata,
-    Column("order_id", Integer, primary_key=True),
-    Column("customer_id", ForeignKey("customers.id")),
-    Column("product_id", ForeignKey("products.id")),
-    Column("order_date", Date),
-    Column("quantity", Integer),
-)
-
-
-class Product(Base):
-    __tablename__ = "products"
-    id = Column(Integer(), primary_key=True)
-    name = Column(String())
-    brand = Column(String())
-    price = Column(Integer())
-    quantity = Column(Integer())
-    customers = relationship("Customer", secondary=orders, back_populates="products")
-
-
-class Customer(Base):
-    __tablename__ = "customers"
-    id = Column(Integer(), primary_key=True)
-    name = Column(String())
-    email = Column(String())
-    username = Column(String())
-    role = Column(String())
-    products = relationship("Product", secondary=orders, back_populates="customers")
-
-
-def get_most_sold_products(session):
-    # Query the database to get the products sorted by the total quantity sold in descending order
-    # Return the sorted list of products
-    products = (
-        session.query(Product)
-        .join(orders)
-        .group_by(Product.id)
-        .order_by(Product.quantity.desc())
-        .all()
-    )
-    return products
-
-
-def get_least_sold_products(session):
-    # Query the database to get the products sorted by the total quantity sold in ascending order
-    # Return the sorted list of products
-    products = (
-        session.query(Product)
-        .join(orders)
-        .group_by(Product.id)
-        .order_by(Product.quantity)
-        .all()
-    )
-    return products
-
-
-def get_never_sold_products(session):
-    # Query the database to get the products that have never been sold
-    # Return the list of products
-    products = (
-        session.query(Product)
-        .outerjoin(orders)
-        .group_by(Product.id)
-        .having(~orders.c.product_id.isnot(None))
-        .all()
-    )
-    return products
-
-
-def get_products_purchased_in_date_range(session, start_date, end_date):
-    # Query the database to get the products purchased within the specified date range
-    # Return the list of products
-    products = (
-        session.query(Product)
-        .join(orders)
-        .filter(orders.c.order_date.between(start_date, end_date))
-        .all()
-    )
-    return products
-
-
-@click.command()
-@click.option("--role", prompt="Enter your role (stock manager/user): ")
-def main(role):
-    if role == "stockmanager":
-        print("Menu:")
-        print("1. Add a product")
-        print("2. View available products")
-        print("3. Update a product")
-        print("4. Delete a product")
-        print("5. Generate reports")
-        print("6. Exit")
-
-        choice = input("Enter your choice: ")
-
-        if choice == "1":
-            name = input("Enter product name: ")
-            brand = input("Enter product brand: ")
-            price = int(input("Enter product price: "))
-            quantity = int(input("Enter product quantity: "))
-
-            product = Product(name=name, brand=brand, price=price, quantity=quantity)
-            session.add(product)
-            session.commit()
-            print("Product added successfully!")
-
-        elif choice == "2":
-            products = session.query(Product).all()
-            print("Available products:")
-            for product in products:
-                print(
-                    f"ID: {product.id}, Name: {product.name}, Brand: {product.brand}, Price: {product.price}, Quantity: {product.quantity}"
-                )
-
-        elif choice == "3":
-            # Code for updating a product
-            product_id = int(input("Enter the ID of the product to update: "))
-            product = session.query(Product).get(product_id)
-            if product is None:
-                print("Invalid product ID!")
-            else:
-                print("Menu:")
-                print("1. Add quantity")
-                print("2. Remove product")
-
-                update_choice = input("Enter your choice: ")
-
-                if update_choice == "1":
-                    quantity = int(input("Enter the quantity to add: "))
-                    product.quantity += quantity
-                    session.commit()
-                    print("Quantity added successfully!")
-                elif update_choice == "2":
-                    session.delete(product)
-                    session.commit()
-                    print("Product removed successfully!")
-                else:
-                    print("Invalid choice!")
-
-        elif choice == "4":
-            # Code for deleting a product
-            product_id = int(input("Enter the ID of the product to delete: "))
-            delete_product = delete(Product).where(Product.id == product_id)
-            session.execute(delete_product)
-            session.commit()
-            print("Product deleted successfully!")
-
-        elif choice == "5":
-            print("Report Menu:")
-            print("1. Most sold products")
-            print("2. Least sold products")
-            print("3. Never sold products")
-            print("4. Products purchased in a date range")
-
-            report_choice = input("Enter your choice: ")
-
-            if report_choice == "1":
-                most_sold_products = get_most_sold_products(session)
-                print("Most sold products:")
-                for product in most_sold_products:
-                    print(
-                        f"ID: {product.id}, Name: {product.name}, Brand: {product.brand}, Price: {product.price}, Quantity: {product.quantity}"
-                    )
-
-            elif report_choice == "2":
-                least_sold_products = get_least_sold_products(session)
-                print("Least sold products:")
-                for product in least_sold_products:
-                    print(
-                        f"ID: {product.id}, Name: {product.name}, Brand: {product.brand}, Price: {product.price}, Quantity: {product.quantity}"
-                    )
-
-            elif report_choice == "3":
-                never_sold_products = get_never_sold_products(session)
-                print("Never sold products:")
-                for product in never_sold_products:
-                    print(
-                        f"ID: {product.id}, Name: {product.name}, Brand: {product.brand}, Price: {product.price}, Quantity: {product.quantity}"
-                    )
-
-            elif report_choice == "4":
-                start_date = input("Enter the start date (YYYY-MM-DD): ")
-                end_date = input("Enter the end date (YYYY-MM-DD): ")
-                products_purchased = get_products_purchased_in_date_range(
-                    session, start_date, end_date
-                )
-                print("Products purchased in the specified date range:")
-                for product in products_purchased:
-                    print(
-                        f"ID: {product.id}, Name: {product.name}, Brand: {product.brand}, Price: {product.price}, Quantity: {product.quantity}"
-                    )
-
-            else:
-                print("Invalid choice!")
-
-        elif choice == "6":
-            return
-
-        else:
-            print("Invalid choice!")
-
-    elif role == "user":
-        # Code for user role
-        username = input("Enter your username: ")
-        customer = session.query(Customer).filter_by(username=username).first()
-
-        if customer is None:
-            print("Invalid username!")
-
-    else:
-        print("Invalid role!")
-
-    print()
-
-
-if __name__ == "__main__":
-    Base.metadata.create_all(engine)
-
-    Session = sessionmaker(bind=engine)
-    session = Session()
-
-    main()
-    print("Exiting the menu.")
\ No newline at end of file
+    cli()
@@ -0,0 +1,97 @@
+import datetime
+import json
+import time
+
+from cache import RecordCache
+from models import as_record, current_data_version, report_results, settings, upsert_insert
+
+
+# Cache of report results keyed by report name, parameters and the data
+# version. Any write bumps the version, so a cached result is served only
+# while nothing it depends on has changed. Results are kept in memory and
+# in the report_results table, which lets separate CLI processes share them.
+class ReportCache:
+    def __init__(self, max_size=256, persist=True):
+        self.memory = RecordCache(max_size, ttl=float("inf"))
+        self.persist = persist
+        self.disk_hits = 0
+        self.recomputes = 0
+        self.compute_ms_total = 0.0
+        self.compute_ms_last = 0.0
+
+    @staticmethod
+    def key(name, params):
+        return f"{name}:{json.dumps(params, sort_keys=True, default=str)}"
+
+    # Function to return the report as a list of dicts, computing it with
+    # function(session, **params) only when no current cached copy exists
+    def get(self, session, name, function, **params):
+        key = self.key(name, params)
+        version = current_data_version(session)
+        return self.memory.get(
+            (key, version), lambda _: self._load(session, key, version, function, params)
+        )
+
+    def _load(self, session, key, version, function, params):
+        if self.persist:
+            stored = session.execute(
+                report_results.select().where(
+                    report_results.c.key == key, report_results.c.data_version == version
+                )
+            ).first()
+            if stored is not None:
+                self.disk_hits += 1
+                return json.loads(stored.result)
+
+        started = time.perf_counter()
+        result = [as_record(row) for row in function(session, **params)]
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.recomputes += 1
+        self.compute_ms_total += elapsed_ms
+        self.compute_ms_last = elapsed_ms
+
+        if self.persist:
+            self._store(session, key, version, result, elapsed_ms)
+        return result
+
+    def _store(self, session, key, version, result, elapsed_ms):
+        values = {
+            "key": key,
+            "data_version": version,
+            "result": json.dumps(result, default=str),
+            "computed_at": datetime.datetime.now(),
+            "compute_ms": elapsed_ms,
+        }
+        # End the read transaction the report ran in, so the write starts a
+        # fresh transaction instead of upgrading a snapshot that SQLite
+        # refuses to upgrade once another process has written since
+        session.commit()
+        statement = upsert_insert(session, report_results)
+        if statement is None:
+            session.execute(report_results.delete().where(report_results.c.key == key))
+            session.execute(report_results.insert().values(**values))
+        else:
+            statement = statement.values(**values)
+            session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=["key"],
+                    set_={name: statement.excluded[name] for name in values if name != "key"},
+                )
+            )
+        session.commit()
+
+    def stats(self):
+        memory = self.memory.stats()
+        lookups = memory["hits"] + memory["misses"]
+        served = memory["hits"] + self.disk_hits
+        return {
+            "memory_hits": memory["hits"],
+            "disk_hits": self.disk_hits,
+            "recomputes": self.recomputes,
+            "hit_ratio": served / lookups if lookups else 0.0,
+            "recompute_ms_total": self.compute_ms_total,
+            "recompute_ms_last": self.compute_ms_last,
+        }
+
+
+report_cache = ReportCache(persist=bool(settings["report_cache_persist"]))
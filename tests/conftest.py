@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+# The application modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generate import generate  # noqa: E402
+from config import build_engine, load_settings  # noqa: E402
+from models import ensure_schema  # noqa: E402
+
+
+# Engine on a fresh SQLite file, built like the application's own engine
+def make_engine(path):
+    return build_engine(dict(load_settings(), database_url=f"sqlite:///{path}"))
+
+
+# Empty database with the current schema, one per test
+@pytest.fixture
+def engine(tmp_path):
+    engine = make_engine(tmp_path / "test.db")
+    with engine.begin() as connection:
+        ensure_schema(connection)
+    yield engine
+    engine.dispose()
+
+
+# Database seeded once per test module with a small reproducible dataset
+@pytest.fixture(scope="module")
+def seeded_engine(tmp_path_factory):
+    engine = make_engine(tmp_path_factory.mktemp("db") / "seeded.db")
+    generate(engine, products=300, customers=50, order_count=2000, seed=7)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def seeded_session(seeded_engine):
+    with sessionmaker(bind=seeded_engine)() as session:
+        yield session
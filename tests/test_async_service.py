@@ -0,0 +1,41 @@
+import asyncio
+
+from sqlalchemy import func, insert, select
+
+from async_service import ProductService, handle_request
+from config import build_async_engine, load_settings
+from models import Customer, Product, orders
+
+
+def test_create_cart_answers_with_the_orders(engine):
+    with engine.begin() as connection:
+        connection.execute(insert(Customer.__table__).values(id=1, name="Ann", username="ann"))
+        connection.execute(
+            insert(Product.__table__),
+            [
+                {"id": 1, "name": "pen", "brand": "Bic", "price": 10, "quantity": 5},
+                {"id": 2, "name": "ink", "brand": "Bic", "price": 20, "quantity": 5},
+            ],
+        )
+
+    async def create_cart():
+        url = engine.url.render_as_string(hide_password=False)
+        service = ProductService(build_async_engine(dict(load_settings(), database_url=url)))
+        try:
+            return await handle_request(
+                service,
+                {
+                    "id": 7,
+                    "op": "order.create_cart",
+                    "args": {"customer_id": 1, "lines": [[1, 2], [2, 1]]},
+                },
+            )
+        finally:
+            await service.close()
+
+    response = asyncio.run(create_cart())
+
+    assert response["ok"], response
+    assert [(row["product_id"], row["quantity"]) for row in response["result"]] == [(1, 2), (2, 1)]
+    with engine.connect() as connection:
+        assert connection.execute(select(func.count()).select_from(orders)).scalar() == 2
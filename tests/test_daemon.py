@@ -0,0 +1,11 @@
+import products
+from daemon import run_command
+
+
+def test_watch_stock_needs_once_in_the_shell(seeded_session, capsys):
+    assert run_command(products.cli, seeded_session, "product watch-stock --interval 0.01") == 2
+    assert "use --once" in capsys.readouterr().err
+
+
+def test_watch_stock_once_returns(seeded_session):
+    assert run_command(products.cli, seeded_session, "product watch-stock --once") == 0
@@ -0,0 +1,54 @@
+from sqlalchemy import event, insert
+from sqlalchemy.orm import sessionmaker
+
+from models import (
+    Customer,
+    Product,
+    current_data_version,
+    purchase,
+    purchase_cart,
+    purchase_carts,
+    update_product,
+)
+
+
+# Statements run on the engine, with "COMMIT" marking each commit
+def record_statements(engine):
+    statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    @event.listens_for(engine, "commit")
+    def record_commit(connection):
+        statements.append("COMMIT")
+
+    return statements
+
+
+def test_checkouts_bump_the_version_after_committing(engine):
+    with engine.begin() as connection:
+        connection.execute(insert(Customer.__table__).values(id=1, username="buyer"))
+        connection.execute(
+            insert(Product.__table__).values(id=1, name="pen", price=10, quantity=50)
+        )
+    statements = record_statements(engine)
+
+    with sessionmaker(bind=engine)() as session:
+        for checkout in (
+            lambda: purchase(session, 1, 1, 1),
+            lambda: purchase_cart(session, 1, [(1, 1)]),
+            lambda: purchase_carts(session, [(1, [(1, 1)], None)]),
+            lambda: update_product(session, 1, add_quantity=5),
+        ):
+            before = current_data_version(session)
+            session.rollback()
+            del statements[:]
+            checkout()
+
+            first_commit = statements.index("COMMIT")
+            assert not any("data_versions" in statement for statement in statements[:first_commit])
+            assert any("data_versions" in statement for statement in statements[first_commit:])
+            assert current_data_version(session) != before
+            session.rollback()
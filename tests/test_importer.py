@@ -0,0 +1,38 @@
+import json
+
+from sqlalchemy import func, insert, select
+
+from importer import import_orders
+from models import Customer, Product, daily_product_sales, orders
+
+ORDERS = [
+    {"order_id": 1, "customer_id": 1, "product_id": 1, "order_date": "2024-05-01", "quantity": 3},
+    {"order_id": 1, "customer_id": 1, "product_id": 1, "order_date": "2024-05-01", "quantity": 3},
+    {"order_id": 2, "customer_id": 1, "product_id": 1, "order_date": "2024-05-01", "quantity": 2},
+    {"customer_id": 1, "product_id": 1, "order_date": "2024-05-01", "quantity": 1},
+]
+
+
+# Units and order count for product 1 on the day, from the rollup and from orders
+def sales(engine):
+    with engine.connect() as connection:
+        rollup = connection.execute(
+            select(daily_product_sales.c.units, daily_product_sales.c.order_count)
+        ).one()
+        actual = connection.execute(select(func.sum(orders.c.quantity), func.count())).one()
+    return tuple(rollup), tuple(actual)
+
+
+def test_reimporting_orders_does_not_double_the_rollup(engine, tmp_path):
+    with engine.begin() as connection:
+        connection.execute(insert(Customer.__table__).values(id=1, username="buyer"))
+        connection.execute(insert(Product.__table__).values(id=1, name="pen", price=5, quantity=0))
+    path = tmp_path / "orders.jsonl"
+    path.write_text("".join(json.dumps(row) + "\n" for row in ORDERS))
+
+    assert import_orders(engine, str(path), batch_size=2) == (3, [])
+    assert sales(engine) == ((6, 3), (6, 3))
+
+    # Keyed orders are already there; only the order without an id is new
+    assert import_orders(engine, str(path), batch_size=2) == (1, [])
+    assert sales(engine) == ((7, 4), (7, 4))
@@ -0,0 +1,30 @@
+from sqlalchemy import insert, select
+
+from instrumentation import QueryProfiler
+from models import Product
+
+
+def test_rows_fetched_are_counted_and_pages_are_not_n_plus_one(engine):
+    with engine.begin() as connection:
+        connection.execute(
+            insert(Product.__table__),
+            [{"id": i, "name": f"product {i}", "price": 1, "quantity": 1} for i in range(1, 61)],
+        )
+    profiler = QueryProfiler(n_plus_one_threshold=10).attach(engine)
+    page = select(Product.id).order_by(Product.id).limit(5)
+    with engine.connect() as connection:
+        for after_id in range(0, 60, 5):
+            connection.execute(page.where(Product.id > after_id)).all()
+        for product_id in range(1, 13):
+            connection.execute(select(Product.name).where(Product.id == product_id)).first()
+    profiler.detach()
+
+    rows = {
+        statement.split()[1]: (stats.calls, stats.rows)
+        for statement, stats in profiler.statements.items()
+        if statement.startswith("SELECT")
+    }
+    assert rows == {"products.id": (12, 60), "products.name": (12, 12)}
+    assert [statement.split()[1] for statement, _ in profiler.n_plus_one_suspects()] == [
+        "products.name"
+    ]
@@ -0,0 +1,99 @@
+import json
+
+import pytest
+from sqlalchemy import func, insert, select
+
+import journal
+from journal import OrderJournal, save_checkpoint
+from models import Customer, Product, PurchaseError, orders
+
+
+def add_stock(engine, quantity):
+    with engine.begin() as connection:
+        connection.execute(insert(Customer.__table__).values(id=1, name="Ann", username="ann"))
+        connection.execute(
+            insert(Product.__table__).values(
+                id=1, name="pen", brand="Bic", price=10, quantity=quantity
+            )
+        )
+
+
+def order_count_and_stock(engine):
+    with engine.connect() as connection:
+        return (
+            connection.execute(select(func.count()).select_from(orders)).scalar(),
+            connection.execute(select(Product.quantity).where(Product.id == 1)).scalar(),
+        )
+
+
+def test_replay_applies_only_entries_after_the_checkpoint(engine, tmp_path):
+    add_stock(engine, 23)
+    path = tmp_path / "orders.journal"
+    with open(path, "w", encoding="utf-8") as handle:
+        for seq in (1, 2):
+            entry = {"seq": seq, "customer_id": 1, "lines": [[1, 1]], "order_date": "2025-01-05"}
+            handle.write(json.dumps(entry) + "\n")
+    with engine.begin() as connection:
+        save_checkpoint(connection, path.name, 1)
+
+    order_journal = OrderJournal(str(path), engine, flush_ms=10).start()
+    assert order_journal.flush(timeout=5)
+    order_journal.stop()
+
+    assert order_journal.stats["replayed"] == 1
+    assert order_count_and_stock(engine) == (1, 22)
+
+
+def test_failure_after_the_commit_is_not_applied_twice(engine, tmp_path, monkeypatch):
+    add_stock(engine, 23)
+    order_journal = OrderJournal(str(tmp_path / "orders.journal"), engine, flush_ms=10).start()
+
+    read_stock = order_journal._read_stock
+    failures = []
+
+    def fail_once(product_ids):
+        if not failures:
+            failures.append(product_ids)
+            raise RuntimeError("transient failure")
+        return read_stock(product_ids)
+
+    monkeypatch.setattr(order_journal, "_read_stock", fail_once)
+    order_journal.purchase(1, [(1, 2)])
+    assert order_journal.flush(timeout=5)
+    order_journal.stop()
+
+    assert failures
+    assert order_count_and_stock(engine) == (1, 21)
+
+
+def test_retry_skips_a_batch_committed_before_the_failure(engine, tmp_path, monkeypatch):
+    add_stock(engine, 23)
+    order_journal = OrderJournal(str(tmp_path / "orders.journal"), engine, flush_ms=10).start()
+
+    purchase_carts = journal.purchase_carts
+    calls = []
+
+    def commit_then_fail(session, carts):
+        calls.append(carts)
+        results = purchase_carts(session, carts)
+        if len(calls) == 1:
+            raise RuntimeError("transient failure")
+        return results
+
+    monkeypatch.setattr(journal, "purchase_carts", commit_then_fail)
+    order_journal.purchase(1, [(1, 2)])
+    assert order_journal.flush(timeout=5)
+    order_journal.stop()
+
+    assert len(calls) == 1
+    assert order_journal.stats["failed_flushes"] == 1
+    assert order_count_and_stock(engine) == (1, 21)
+
+
+def test_unknown_customer_is_refused_when_accepting(engine, tmp_path):
+    add_stock(engine, 23)
+    order_journal = OrderJournal(str(tmp_path / "orders.journal"), engine, flush_ms=10).start()
+    with pytest.raises(PurchaseError, match="Invalid customer ID"):
+        order_journal.purchase(99, [(1, 1)])
+    order_journal.stop()
+    assert order_count_and_stock(engine) == (0, 23)
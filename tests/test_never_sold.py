@@ -0,0 +1,51 @@
+import datetime
+
+from sqlalchemy import select
+
+from models import Product, get_never_sold_products, orders
+
+
+# Product ids with no order on or after `since`, worked out from the orders
+# table directly instead of the daily sales rollup the report reads
+def never_sold_brute_force(session, since=None):
+    sold = select(orders.c.product_id)
+    if since is not None:
+        sold = sold.where(orders.c.order_date >= since)
+    sold_ids = set(session.execute(sold).scalars())
+    all_ids = session.execute(select(Product.id)).scalars()
+    return sorted(product_id for product_id in all_ids if product_id not in sold_ids)
+
+
+def test_full_list_matches_orders(seeded_session):
+    expected = never_sold_brute_force(seeded_session)
+    assert expected, "the seeded dataset should leave some products unsold"
+    assert [row.id for row in get_never_sold_products(seeded_session)] == expected
+
+
+def test_since_only_counts_recent_sales(seeded_session):
+    since = datetime.date.today() - datetime.timedelta(days=90)
+    expected = never_sold_brute_force(seeded_session, since)
+    assert len(expected) > len(never_sold_brute_force(seeded_session))
+    assert [row.id for row in get_never_sold_products(seeded_session, since=since)] == expected
+
+
+def test_pages_chain_by_after_id(seeded_session):
+    expected = never_sold_brute_force(seeded_session)
+    page_size = len(expected) // 3
+
+    first = get_never_sold_products(seeded_session, page_size=page_size)
+    second = get_never_sold_products(
+        seeded_session, page_size=page_size, after_id=first[-1].id
+    )
+    assert [row.id for row in first + second] == expected[: 2 * page_size]
+
+
+def test_rows_carry_the_product_details(seeded_session):
+    row = get_never_sold_products(seeded_session, page_size=1)[0]
+    product = seeded_session.get(Product, row.id)
+    assert (row.name, row.brand, row.price, row.quantity) == (
+        product.name,
+        product.brand,
+        product.price,
+        product.quantity,
+    )
@@ -0,0 +1,52 @@
+import datetime
+
+import pytest
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from models import Product, get_products_purchased_in_date_range, orders, rebuild_daily_sales
+from parallel import get_parallel_purchases_in_date_range
+
+# Columns both date-range reports compute the same way. Revenue differs on
+# purpose: the rollup keeps the price at order time, the orders scan can
+# only use the current price.
+COMMON = ("id", "units_sold", "order_count", "first_sale", "last_sale")
+
+
+def common_columns(rows, grouped):
+    columns = ("period", *COMMON) if grouped else COMMON
+    return [tuple(getattr(row, column) for column in columns) for row in rows]
+
+
+@pytest.mark.parametrize("group_by", [None, "week", "month"])
+def test_range_matches_rollup(seeded_session, group_by):
+    end = datetime.date.today()
+    start = end - datetime.timedelta(days=120)
+    expected = get_products_purchased_in_date_range(seeded_session, start, end, group_by).all()
+    assert expected
+    rows = get_parallel_purchases_in_date_range(seeded_session, start, end, group_by, workers=2)
+    grouped = group_by is not None
+    assert common_columns(rows, grouped) == common_columns(expected, grouped)
+
+
+def test_undated_orders_are_skipped_and_revenue_is_at_current_price(engine):
+    with engine.begin() as connection:
+        connection.execute(
+            insert(Product.__table__).values(id=1, name="pen", brand="Bic", price=10, quantity=0)
+        )
+        connection.execute(
+            insert(orders),
+            [
+                {"product_id": 1, "order_date": datetime.date(2025, 1, 5), "quantity": 2},
+                {"product_id": 1, "order_date": None, "quantity": 7},
+            ],
+        )
+        rebuild_daily_sales(connection)
+        connection.execute(update(Product.__table__).values(price=15))
+
+    with Session(engine) as session:
+        [rollup] = get_products_purchased_in_date_range(session).all()
+        [scan] = get_parallel_purchases_in_date_range(session, workers=1)
+    assert (scan.units_sold, scan.order_count) == (rollup.units_sold, rollup.order_count) == (2, 1)
+    assert rollup.revenue == 20
+    assert scan.revenue_at_current_price == 30
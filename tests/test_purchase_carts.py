@@ -0,0 +1,100 @@
+import pytest
+from sqlalchemy import event, func, insert, select, text
+from sqlalchemy.orm import sessionmaker
+
+from conftest import make_engine
+from models import Customer, Product, PurchaseError, orders, purchase, purchase_cart, purchase_carts
+
+STOCK = {1: 10, 2: 10, 3: 1}
+
+
+@pytest.fixture
+def session(engine):
+    with engine.begin() as connection:
+        connection.execute(insert(Customer.__table__), [{"id": 1, "username": "buyer"}])
+        connection.execute(
+            insert(Product.__table__),
+            [
+                {"id": product_id, "name": f"product {product_id}", "price": 100, "quantity": qty}
+                for product_id, qty in STOCK.items()
+            ],
+        )
+    with sessionmaker(bind=engine)() as session:
+        yield session
+
+
+# Stock and order count as another connection sees them
+def committed_state(engine):
+    with engine.connect() as connection:
+        stock = dict(connection.execute(select(Product.id, Product.quantity)).all())
+        order_count = connection.execute(select(func.count()).select_from(orders)).scalar()
+    return stock, order_count
+
+
+# Make every insert into orders fail, as a constraint violation would
+def fail_order_inserts(engine):
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TRIGGER fail_orders BEFORE INSERT ON orders "
+                "BEGIN SELECT RAISE(ABORT, 'order insert failed'); END"
+            )
+        )
+
+
+# Both the fast path (every cart filled) and the per-cart fallback (one
+# cart short of stock)
+CART_BATCHES = {
+    "all_filled": [(1, [(1, 2)], None), (1, [(2, 3), (1, 1)], None)],
+    "one_short": [(1, [(1, 2)], None), (1, [(3, 5)], None), (1, [(2, 3)], None)],
+}
+
+
+@pytest.mark.parametrize("carts", CART_BATCHES.values(), ids=CART_BATCHES.keys())
+def test_stock_is_not_committed_before_the_orders(engine, session, carts):
+    observer = make_engine(engine.url.database)
+    seen = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def look_from_another_connection(connection, cursor, statement, *args):
+        if statement.startswith("INSERT INTO orders"):
+            seen.append(committed_state(observer))
+
+    purchase_carts(session, carts)
+    observer.dispose()
+
+    assert seen == [(STOCK, 0)]
+
+
+@pytest.mark.parametrize("carts", CART_BATCHES.values(), ids=CART_BATCHES.keys())
+def test_failed_order_insert_rolls_back_the_stock(engine, session, carts):
+    fail_order_inserts(engine)
+    with pytest.raises(Exception, match="order insert failed"):
+        purchase_carts(session, carts)
+    assert committed_state(engine) == (STOCK, 0)
+
+
+def test_failed_order_insert_rolls_back_a_single_cart(engine, session):
+    fail_order_inserts(engine)
+    with pytest.raises(Exception, match="order insert failed"):
+        purchase_cart(session, 1, [(1, 2), (2, 1)])
+    assert committed_state(engine) == (STOCK, 0)
+
+
+def test_batch_commits_stock_and_orders_together(engine, session):
+    results = purchase_carts(session, CART_BATCHES["one_short"])
+    assert [error is None for _, error in results] == [True, False, True]
+    assert committed_state(engine) == ({1: 8, 2: 7, 3: 1}, 2)
+
+
+def test_unknown_customer_gets_no_order(engine, session):
+    with pytest.raises(PurchaseError, match="Invalid customer ID"):
+        purchase(session, 99, 1, 1)
+    with pytest.raises(PurchaseError, match="Invalid customer ID"):
+        purchase_cart(session, 99, [(1, 1)])
+    results = purchase_carts(session, [(99, [(1, 1)], None), (1, [(1, 1)], None)])
+    assert [str(error) if error else None for _, error in results] == [
+        "Invalid customer ID: 99",
+        None,
+    ]
+    assert committed_state(engine) == ({1: 9, 2: 10, 3: 1}, 1)
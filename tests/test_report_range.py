@@ -0,0 +1,36 @@
+import json
+
+from click.testing import CliRunner
+from sqlalchemy.orm import sessionmaker
+
+import products
+from models import get_products_purchased_in_date_range
+from reports import report_cache
+
+
+def test_range_streams_past_the_report_cache(seeded_engine, monkeypatch):
+    monkeypatch.setattr(products, "Session", sessionmaker(bind=seeded_engine))
+    recomputes = report_cache.recomputes
+
+    result = CliRunner().invoke(products.cli, ["--format", "json", "report", "range"])
+
+    assert result.exit_code == 0, result.output
+    assert report_cache.recomputes == recomputes
+    with sessionmaker(bind=seeded_engine)() as session:
+        expected = get_products_purchased_in_date_range(session).all()
+    rows = [json.loads(line) for line in result.output.splitlines()]
+    assert [(row["id"], row["units_sold"]) for row in rows] == [
+        (row.id, row.units_sold) for row in expected
+    ]
+
+
+def test_range_rejects_a_reversed_range(seeded_engine, monkeypatch):
+    monkeypatch.setattr(products, "Session", sessionmaker(bind=seeded_engine))
+
+    result = CliRunner().invoke(
+        products.cli,
+        ["report", "range", "--start-date", "2025-02-01", "--end-date", "2025-01-01"],
+    )
+
+    assert result.exit_code == 1
+    assert "The start date is after the end date" in result.output
@@ -0,0 +1,58 @@
+import datetime
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import sessionmaker
+
+from models import (
+    Customer,
+    Product,
+    daily_product_sales,
+    orders,
+    purchase,
+    rebuild_daily_sales,
+)
+
+DAY = datetime.date(2025, 1, 5)
+
+
+def rollup(engine):
+    with engine.connect() as connection:
+        return {
+            (row.product_id, row.day): (row.units, row.revenue, row.order_count)
+            for row in connection.execute(select(daily_product_sales))
+        }
+
+
+def test_rebuild_keeps_the_revenue_recorded_at_order_time(engine):
+    with engine.begin() as connection:
+        connection.execute(insert(Customer.__table__).values(id=1, username="buyer"))
+        connection.execute(
+            insert(Product.__table__),
+            [
+                {"id": 1, "name": "pen", "price": 10, "quantity": 50},
+                {"id": 2, "name": "ink", "price": 20, "quantity": 50},
+            ],
+        )
+    with sessionmaker(bind=engine)() as session:
+        purchase(session, 1, 1, 3, DAY)
+        purchase(session, 1, 2, 1, DAY)
+    with engine.begin() as connection:
+        connection.execute(update(Product.__table__).values(price=Product.price * 2))
+        # An order the rollup never saw, and a day whose orders are gone
+        connection.execute(
+            insert(orders).values(customer_id=1, product_id=1, order_date=DAY, quantity=1)
+        )
+        connection.execute(delete(orders).where(orders.c.product_id == 2))
+        connection.execute(
+            insert(orders).values(
+                customer_id=1, product_id=2, order_date=DAY + datetime.timedelta(days=1), quantity=2
+            )
+        )
+        assert rebuild_daily_sales(connection) == 2
+
+    assert rollup(engine) == {
+        # Four units at the price recorded for the first three
+        (1, DAY): (4, 40, 2),
+        # A product day new to the rollup is priced at the current price
+        (2, DAY + datetime.timedelta(days=1)): (2, 80, 1),
+    }
@@ -0,0 +1,53 @@
+import pytest
+from sqlalchemy import create_mock_engine, text
+
+from conftest import make_engine
+from models import Product, SchemaOutOfDateError, ensure_schema, missing_schema
+
+
+def user_version(connection):
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def test_empty_database_gets_the_whole_schema(tmp_path):
+    engine = make_engine(tmp_path / "empty.db")
+    with engine.begin() as connection:
+        assert ensure_schema(connection)
+        assert missing_schema(connection) == []
+        assert user_version(connection) != 0
+        assert not ensure_schema(connection)
+    engine.dispose()
+
+
+def test_partial_schema_is_refused_and_not_stamped(tmp_path):
+    engine = make_engine(tmp_path / "old.db")
+    with engine.begin() as connection:
+        ensure_schema(connection)
+        connection.exec_driver_sql("DROP INDEX ix_orders_customer_id_order_date")
+        connection.exec_driver_sql("DROP INDEX ix_products_low_stock")
+        connection.exec_driver_sql("ALTER TABLE products DROP COLUMN reorder_threshold")
+        connection.exec_driver_sql("PRAGMA user_version = 0")
+
+    with engine.begin() as connection:
+        with pytest.raises(SchemaOutOfDateError, match="alembic upgrade head") as error:
+            ensure_schema(connection)
+    assert "products.reorder_threshold" in str(error.value)
+    assert "ix_orders_customer_id_order_date" in str(error.value)
+    with engine.connect() as connection:
+        assert user_version(connection) == 0
+        assert connection.execute(text("SELECT count(*) FROM products")).scalar() == 0
+    engine.dispose()
+
+
+def test_low_stock_index_is_partial_on_postgres():
+    statements = []
+
+    def record(statement, *args, **kw):
+        statements.append(str(statement.compile(dialect=engine.dialect)))
+
+    engine = create_mock_engine("postgresql://", record)
+    Product.__table__.create(engine)
+    assert (
+        "CREATE INDEX ix_products_low_stock ON products (quantity) "
+        "WHERE quantity <= reorder_threshold"
+    ) in statements